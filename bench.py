@@ -0,0 +1,974 @@
+#!/usr/bin/python3
+
+##################################################################################################
+#                                                                                        IMPORTS #
+##################################################################################################
+
+import os,re,sys,time,timeit,json,asyncio,argparse,platform,tracemalloc,tempfile
+
+import numpy as np
+
+from lib.sound_lib import *
+from lib.termio import *
+from lib.session import *
+from lib.scheduler import SimClock,run_simulated
+from lib.runtime import SessionRuntime
+from lib.governor import QualityGovernor
+from lib.prerender import frame_times,prerender_session
+from lib.timeline import PHASE_EVENT
+from lib.daemon import TimerDaemon
+from lib.broadcast import BroadcastServer
+
+##################################################################################################
+#                                                                             CONSTANTS / CONFIG #
+##################################################################################################
+
+BEEP_COUNTS    = [1,5,10,50,100]
+BEEP_DURATIONS = [0.01,0.05,0.25]
+
+REPEATS = 5
+
+SYNTHESIS_TOLERANCE = 1e-6 # largest difference allowed from the legacy waveform
+
+LEGACY_SAMPLE_RATE = 64100 # the rate play_beep used to hardcode
+
+DAB_TEXT = "\n" + ("DAB! "*4 + "\n")*5
+HEAT_TEXT = "\nHEAT\n\n" + progress_bar(21,0.37) + "\n\n" + "{:<6}".format("9.25")
+
+SCREEN_SIZES = [(80,24),(160,48),(320,90)]
+
+CHECK_SESSION = (3,3,4)
+ALLOCATION_FRAMES = 300
+
+# Escapes the terminal model understands: ESC 7 / ESC 8, and CSI sequences
+# (only cursor down / forward and SGR change anything)
+TERMINAL_TOKEN = re.compile("\u001b([78])|\u001b\\[([?0-9;]*)([A-Za-z])|(.)",re.S)
+SIMULATED_SESSIONS = [(heat,cool,timeout) for heat in (1,2,5,25) for cool in (1,3,25) for timeout in (0,8)]
+SIMULATED_TOLERANCE = 1e-6 # seconds a simulated beep may be off by float rounding
+
+# Voices the AudioEngine check mixes, as (block queued before, synthesize_beep
+# args), loud enough that overlapping ones clip
+ENGINE_VOICES    = [(0,(550,0.02,3,60,0.8)),(2,(350,0.03,2,0,0.8)),(2,(880,0.01,1,0,0.6))]
+ENGINE_BLOCKSIZE = 256
+
+# Sessions (heat, cool, timeout) prerendered in chunks and in a single pass
+PRERENDER_SESSIONS = [(5,5,5),(2,3,6),(1,1,4)]
+PRERENDER_WORKERS  = 4
+
+# Requests of the clients the daemon check connects at once, with the
+# daemon's defaults filling in what they leave out
+DAEMON_DEFAULTS = (1,1,1)
+DAEMON_REQUESTS = ["1 1 1","2 1","1","","1 1 1"]
+DAEMON_TIMEOUT  = 30 # seconds
+
+# Broadcast check: the session shown, seconds the slow viewer's drain
+# takes per frame, and seconds into the session the late viewer connects
+BROADCAST_SESSION    = (1,1,1)
+BROADCAST_SLOW_DRAIN = 0.05
+BROADCAST_LATE_JOIN  = 1.5
+
+# Stand-in frame costs, in seconds, of the full, cheap and uncolored animations
+GOVERNOR_SLOW_COSTS = (0.090,0.012,0.005)
+GOVERNOR_FAST_COSTS = (0.002,0.001,0.001)
+GOVERNOR_FRAMES     = 400
+
+REGRESSION_THRESHOLD = 0.10
+
+SUITES = ["check","termio","synthesis"]
+
+##################################################################################################
+#                                                                                      FUNCTIONS #
+##################################################################################################
+
+######################################################################################
+#                                                                             Timing #
+######################################################################################
+
+def time_call(func, *args, **kwargs):
+    '''
+    Returns the best wall time, in seconds, of a single func(*args, **kwargs)
+    call over REPEATS timing runs.
+    '''
+    timer = timeit.Timer(lambda: func(*args,**kwargs))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat = REPEATS, number = number)) / number
+
+######################################################################################
+#                                                                   Legacy synthesis #
+######################################################################################
+
+def legacy_synthesize_beep(freq_hz, duration_s, count, step = 0, attenuation = 0.3):
+    '''
+    The waveform builder play_beep used before synthesize_beep, kept as the
+    baseline for the synthesis benchmark.
+    '''
+    sample_rate = LEGACY_SAMPLE_RATE
+    sample_space = np.arange(duration_s * count * sample_rate)
+    waveform = np.array([])
+
+    for i in range(count):
+        start_segment = int(sample_rate*duration_s*i)
+        end_segment = int(sample_rate*duration_s*(i+1))
+        sub_sample_space = sample_space[start_segment:end_segment]
+
+        new_segment = np.sin(2*np.pi*sub_sample_space*freq_hz/sample_rate)
+        waveform = np.append(waveform,new_segment)
+
+        freq_hz += step
+
+    return waveform * attenuation
+
+######################################################################################
+#                                                                   Legacy animation #
+######################################################################################
+
+def legacy_vert_lines(text,frame_number,color_sequence,inverted = False):
+    '''
+    The vert_lines kernel that colored every character, kept as the
+    reference for check_vert_lines and the animation benchmark.
+    '''
+    frame = []
+    for line_text in text.split("\n"):
+        animated_line = ""
+        for char_index,char in enumerate(line_text):
+            if inverted:
+                char_index *= -1
+            color_index = (frame_number+char_index) % len(color_sequence*2)
+            if(color_index >= len(color_sequence)): color_index = len(color_sequence) - (color_index - len(color_sequence)) - 1
+            animated_line += color_sequence[color_index] + char
+        frame.append(animated_line)
+    return "\n".join(frame)
+
+######################################################################################
+#                                                                             Checks #
+######################################################################################
+
+def dab_frame():
+    '''
+    Returns the uncolored frame dab.py draws during the DAB phase.
+    '''
+    art_height = len(ASCII_POT_LEAF.split("\n"))
+    banner = make_banner(DAB_TEXT,23,art_height)
+    return multi_line_join(ASCII_POT_LEAF,banner,ASCII_POT_LEAF,padding=2)
+
+def check_vert_lines():
+    '''
+    Checks that vert_lines renders to the same cells as legacy_vert_lines,
+    for every phase of every color sequence, both directions. Raises an
+    Exception on the first mismatch.
+    '''
+    frame = dab_frame()
+    sequences = [COLORS_RAINBOW_16,COLORS_RED,COLORS_BLUE,COLORS_TEST]
+
+    for color_sequence in sequences:
+        for inverted in (False,True):
+            for frame_number in range(len(color_sequence)*2):
+                expected, expected_style = rasterize(legacy_vert_lines(frame,frame_number,color_sequence,inverted))
+                actual, actual_style = rasterize(vert_lines(frame,frame_number,color_sequence,inverted))
+                if actual != expected or actual_style[1] != expected_style[1]:
+                    raise Exception("vert_lines output differs. (Frame: {}) (Inverted: {})".format(frame_number,inverted))
+
+    sys.stdout.write("vert_lines matches legacy output\n")
+
+def string_frame(session, cur_time, frame_num):
+    '''
+    Returns the frame session.render draws at cur_time, built with the string
+    functions (make_banner, multi_line_join and the animation) instead.
+    '''
+    animation, color_sequence, inverted, speed, framerate = PHASE_ANIMATIONS[session.phase(cur_time)]
+    banner = make_banner(session.frame_text(cur_time),BANNER_WIDTH,session.art_height)
+    frame = multi_line_join(session.art,banner,session.art,padding=SECTION_PADDING)
+    return animation(frame,int(frame_num * speed),color_sequence,inverted)
+
+def check_canvas():
+    '''
+    Checks that every frame of a CHECK_SESSION session drawn on the Canvas
+    renders to the same cells as the string pipeline, that FrameRenderer
+    writes the same output for the canvas as for its text, and that each
+    canvas animation matches its string version with the 256 colors of
+    COLORS_ALL. Raises an Exception on the first mismatch.
+    '''
+    session = Session(*CHECK_SESSION,art = ASCII_POT_LEAF)
+    canvas_output, text_output = [], []
+    canvas_renderer, text_renderer = FrameRenderer(canvas_output.append), FrameRenderer(text_output.append)
+    cur_time = 0
+    frame_num = 0
+
+    while cur_time < session.end_time:
+        frame, framerate = session.render(cur_time,frame_num)
+        expected, expected_style = rasterize(string_frame(session,cur_time,frame_num))
+        actual, actual_style = rasterize(str(frame))
+        if actual != expected or actual_style[1] != expected_style[1]:
+            raise Exception("Canvas frame differs. (Frame: {}) (Phase: {})".format(frame_num,session.phase(cur_time)))
+
+        text_renderer.render(str(frame))
+        canvas_renderer.render(frame)
+        if canvas_output[-1] != text_output[-1] or canvas_renderer.keyframe() != text_renderer.keyframe():
+            raise Exception("Canvas renders differently. (Frame: {}) (Phase: {})".format(frame_num,session.phase(cur_time)))
+
+        cur_time += framerate
+        frame_num += 1
+
+    frame = dab_frame()
+    lines = frame.split("\n")
+    canvas = Canvas(max(map(len,lines)),len(lines))
+    canvas.blit(0,0,frame)
+    for animation, canvas_animation in CANVAS_ANIMATIONS.items():
+        for frame_number in (0,255,256,511):
+            for inverted in (False,True):
+                canvas_animation(canvas,frame_number,COLORS_ALL,inverted)
+                if rasterize(canvas.encode(COLORS_ALL))[0] != rasterize(animation(frame,frame_number,COLORS_ALL,inverted))[0]:
+                    raise Exception("{} differs with COLORS_ALL. (Frame: {}) (Inverted: {})".format(
+                        canvas_animation.__name__,frame_number,inverted))
+
+    sys.stdout.write("canvas matches string pipeline ({} frames)\n".format(frame_num))
+
+class TerminalModel:
+    '''
+    The part of a VT100 / xterm terminal frames depend on: cells holding a
+    char and the style it was written in, a cursor, and ESC 7 / ESC 8
+    saving and restoring the cursor together with the current style.
+    '''
+
+    def __init__(self):
+        self.cells  = {} # (row, col) -> (char, style), None style for spaces
+        self.cursor = (0,0)
+        self.style  = DEFAULT_STYLE
+        self.saved  = ((0,0),DEFAULT_STYLE)
+
+    def feed(self, data):
+        if not isinstance(data,str):
+            data = bytes(data).decode()
+        for match in TERMINAL_TOKEN.finditer(data):
+            save, params, command, char = match.groups()
+            row, col = self.cursor
+            if save == "7":
+                self.saved = (self.cursor,self.style)
+            elif save == "8":
+                self.cursor, self.style = self.saved
+            elif command == "B":
+                self.cursor = (row + int(params or 1),col)
+            elif command == "C":
+                self.cursor = (row,col + int(params or 1))
+            elif command == "m":
+                self.style = apply_sgr(self.style,params)
+            elif char == "\r":
+                self.cursor = (row,0)
+            elif char == "\n":
+                self.cursor = (row + 1,0) # as a tty translating newlines
+            elif char is not None:
+                self.cells[self.cursor] = (char,self.style if char != " " else None)
+                self.cursor = (row,col + 1)
+        return self
+
+    def screen(self):
+        '''
+        Returns the cells that are not blank.
+        '''
+        return {position: cell for position, cell in self.cells.items() if cell[0] != " "}
+
+def check_diff_render():
+    '''
+    Draws every frame of a CHECK_SESSION session through a diffing
+    FrameRenderer and one that redraws each frame in full, with canvas
+    frames and with their text, into TerminalModels, whose ESC 8 restores
+    the color saved by ESC 7 as on VT100 and xterm. Checks both screens
+    hold the same cells in the same colors after every frame, as does a
+    fresh terminal sent the keyframe, and that both park the cursor in
+    the same place. Raises an Exception on the first mismatch.
+    '''
+    session = Session(*CHECK_SESSION,art = ASCII_POT_LEAF)
+    times = frame_times(session)
+
+    for kind, as_frame in (("canvas",lambda frame: frame),("text",str)):
+        terminals = [TerminalModel().feed(SESSION_START),TerminalModel().feed(SESSION_START)]
+        diff_renderer, full_renderer = [FrameRenderer(terminal.feed,diff = diff,binary = True)
+                                        for terminal, diff in zip(terminals,(True,False))]
+
+        for frame_num, cur_time in enumerate(times):
+            frame = as_frame(session.render(cur_time,frame_num)[0])
+            diff_renderer.render(frame)
+            full_renderer.render(frame)
+            keyframe = TerminalModel().feed(SESSION_START).feed(diff_renderer.keyframe())
+            if terminals[0].screen() != terminals[1].screen() or keyframe.screen() != terminals[1].screen():
+                raise Exception("{} diff differs from a full redraw. (Frame: {}) (Phase: {})".format(
+                    kind,frame_num,session.phase(cur_time)))
+
+        diff_renderer.park()
+        full_renderer.park()
+        if terminals[0].cursor != terminals[1].cursor:
+            raise Exception("{} diff parks the cursor at {} instead of {}.".format(kind,terminals[0].cursor,terminals[1].cursor))
+
+    sys.stdout.write("diffs draw the same screen as full redraws ({} frames)\n".format(len(times)))
+
+def check_canvas_allocations():
+    '''
+    Draws ALLOCATION_FRAMES frames of each phase, through a FrameRenderer
+    writing bytes as the runtime's do, both with the string pipeline and
+    on the Canvas, and prints the mean and largest peak of memory
+    tracemalloc sees allocated while drawing a single frame, next to the
+    mean size of the frame's output.
+    '''
+    session = Session(*CHECK_SESSION,art = ASCII_POT_LEAF)
+    sys.stdout.write("{:<8} {:>24} {:>24} {:>10}\n".format("phase","string B/frame mean/max","canvas B/frame mean/max","output B"))
+
+    for phase, start_time in zip(PHASES,(0,session.heat_time,session.total_time)):
+        times = [start_time + (index % 30) / 100 for index in range(ALLOCATION_FRAMES)]
+        text_renderer, canvas_renderer = FrameRenderer(lambda data: None,binary = True), FrameRenderer(lambda data: None,binary = True)
+        pipelines = (lambda cur_time, frame_num: text_renderer.render(string_frame(session,cur_time,frame_num)),
+                     lambda cur_time, frame_num: canvas_renderer.render(session.render(cur_time,frame_num)[0]))
+
+        columns = []
+        for draw in pipelines:
+            for frame_num, cur_time in enumerate(times):
+                draw(cur_time,frame_num) # warm the lookup tables and caches
+
+            peaks = []
+            tracemalloc.start()
+            try:
+                for frame_num, cur_time in enumerate(times):
+                    tracemalloc.reset_peak()
+                    before, _ = tracemalloc.get_traced_memory()
+                    draw(cur_time,frame_num)
+                    _, peak = tracemalloc.get_traced_memory()
+                    peaks.append(peak - before)
+            finally:
+                tracemalloc.stop()
+            columns.append("{:.0f} / {}".format(sum(peaks) / len(peaks),max(peaks)))
+
+        output_bytes = canvas_renderer.total_bytes / canvas_renderer.frames
+        sys.stdout.write("{:<8} {:>24} {:>24} {:>10.0f}\n".format(phase,*columns,output_bytes))
+
+def check_audio_format():
+    '''
+    Checks negotiate_format against stand-in devices, and that int16 beeps
+    match float32 ones scaled to the int16 range. Raises an Exception on
+    the first mismatch.
+    '''
+    def accepts(*dtypes):
+        def check(sample_rate, dtype):
+            if dtype not in dtypes: raise Exception("Unsupported format. (Dtype: {})".format(dtype))
+        return check
+
+    cases = [((None,None,{"default_samplerate":44100.0},accepts("float32","int16")),(44100,"float32")),
+             ((None,None,{"default_samplerate":48000.0},accepts("int16")),           (48000,"int16")),
+             ((None,None,{},                             accepts()),                  (SAMPLE_RATE,SAMPLE_DTYPE)),
+             ((None,"int16",{"default_samplerate":96000.0},accepts()),                (96000,"int16")),
+             ((22050,"float32",None,None),                                            (22050,"float32"))]
+    for args, expected in cases:
+        if negotiate_format(*args) != expected:
+            raise Exception("negotiate_format chose {} instead of {}.".format(negotiate_format(*args),expected))
+
+    float_beep = synthesize_beep(550,0.05,5,60,sample_rate = 48000)
+    int_beep = synthesize_beep(550,0.05,5,60,sample_rate = 48000,dtype = "int16")
+    if int_beep.dtype != np.int16 or np.abs(float_beep * 32767 - int_beep).max() > 0.5:
+        raise Exception("int16 beep does not match the float32 one.")
+
+    sys.stdout.write("negotiate_format and int16 synthesis ok\n")
+
+def check_audio_engine():
+    '''
+    Drives an AudioEngine through a stand-in stream, calling its callback
+    one block at a time, with the overlapping ENGINE_VOICES in float32 and
+    in int16. Checks the output is the voices summed from the block each
+    was queued before, clipped to the format's range rather than wrapped
+    around. Raises an Exception on the first mismatch.
+    '''
+    class StandInStream:
+        def __init__(self, samplerate, channels, dtype, blocksize, callback):
+            self.dtype     = dtype
+            self.blocksize = blocksize
+            self.callback  = callback
+        def start(self): pass
+        def stop(self): pass
+        def close(self): pass
+
+    sample_rate = 48000
+    for dtype in ("float32","int16"):
+        engine = AudioEngine(sample_rate,dtype,stream_factory = StandInStream,blocksize = ENGINE_BLOCKSIZE).start()
+        stream = engine.stream
+        voices = [(block * ENGINE_BLOCKSIZE,synthesize_beep(*args,sample_rate = sample_rate,dtype = dtype))
+                  for block, args in ENGINE_VOICES]
+
+        #--- Play through the callback ----------------------#
+        blocks = []
+        while not blocks or engine.is_active():
+            for start, waveform in voices:
+                if start == len(blocks) * ENGINE_BLOCKSIZE:
+                    engine.play(waveform)
+            outdata = np.full((stream.blocksize,1),1,dtype = stream.dtype) # the callback has to clear it
+            stream.callback(outdata,stream.blocksize,None,None)
+            blocks.append(outdata[:,0].copy())
+        engine.close()
+        output = np.concatenate(blocks)
+
+        #--- Expected mix -----------------------------------#
+        expected = np.zeros(len(output))
+        for start, waveform in voices:
+            expected[start:start + len(waveform)] += waveform
+        low, high = (-1,1) if dtype == "float32" else (np.iinfo(dtype).min,np.iinfo(dtype).max)
+        if expected.max() <= high and expected.min() >= low:
+            raise Exception("ENGINE_VOICES never clip in {}.".format(dtype))
+        expected = expected.clip(low,high)
+
+        if len(output) - max(start + len(waveform) for start, waveform in voices) >= ENGINE_BLOCKSIZE:
+            raise Exception("{} engine kept playing after its voices ended.".format(dtype))
+        error = np.abs(output - expected).max()
+        if error > (1e-6 if dtype == "float32" else 0):
+            raise Exception("{} engine output is off the clipped mix by {}.".format(dtype,error))
+
+    sys.stdout.write("AudioEngine mixes and clips float32 and int16 voices\n")
+
+def check_daemon():
+    '''
+    Starts a silent TimerDaemon on a temporary socket and connects the
+    DAEMON_REQUESTS clients at once. Checks each one receives a complete
+    session, from SESSION_START to a single SESSION_END, and that the
+    daemon is left with no sessions and no socket file once closed.
+    Raises an Exception on the first mismatch.
+    '''
+    async def client(path, request):
+        reader, writer = await asyncio.open_unix_connection(path)
+        writer.write((request + "\n").encode())
+        await writer.drain()
+        data = await reader.read()
+        writer.close()
+        return data
+
+    async def run(path):
+        daemon = await TimerDaemon(path,audio = False,defaults = DAEMON_DEFAULTS).start()
+        try:
+            outputs = await asyncio.wait_for(asyncio.gather(*[client(path,request) for request in DAEMON_REQUESTS]),DAEMON_TIMEOUT)
+        finally:
+            await daemon.close()
+        return daemon, outputs
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory,"dab.sock")
+        start = time.perf_counter()
+        daemon, outputs = asyncio.run(run(path))
+        elapsed = time.perf_counter() - start
+
+        for request, data in zip(DAEMON_REQUESTS,outputs):
+            if not data.startswith(SESSION_START.encode()) or not data.endswith(SESSION_END.encode()):
+                raise Exception("Client {!r} got an incomplete session. ({} bytes)".format(request,len(data)))
+            if data.count(SESSION_END.encode()) != 1:
+                raise Exception("Client {!r} got more than one session end.".format(request))
+        if daemon.sessions or os.path.exists(path):
+            raise Exception("Daemon left sessions or its socket behind.")
+
+    sys.stdout.write("daemon ran {} concurrent sessions to the end in {:.1f} s\n".format(len(DAEMON_REQUESTS),elapsed))
+
+def check_broadcast():
+    '''
+    Shows a BROADCAST_SESSION session through a BroadcastServer on a
+    temporary socket to three viewers: one reading normally, one whose
+    drain takes BROADCAST_SLOW_DRAIN seconds per frame, and one joining
+    BROADCAST_LATE_JOIN seconds in. Checks each ends on the same
+    TerminalModel screen and cursor as the server's final keyframe, that
+    the slow viewer had frames dropped, and that after every write to the
+    first two their screen is one the server drew, in order, so a dropped
+    frame never leaves a viewer out of step. Raises an Exception on the
+    first mismatch.
+    '''
+    async def viewer(path):
+        reader, writer = await asyncio.open_unix_connection(path)
+        data = await reader.read()
+        writer.close()
+        return data
+
+    async def connect(server, path, tasks):
+        tasks.append(asyncio.create_task(viewer(path)))
+        while len(server.viewers) < len(tasks):
+            await asyncio.sleep(0.001)
+        return list(server.viewers)[-1]
+
+    def record(write, writes):
+        def recording_write(data):
+            writes.append(bytes(data))
+            write(data)
+        return recording_write
+
+    async def run(path, published, writes):
+        server = await BroadcastServer(path).start()
+        server.renderer.write = record(server.renderer.write,published)
+        tasks = []
+        try:
+            #--- Normal and slow viewers ------------------------#
+            for viewer_writes in writes:
+                connection = await connect(server,path,tasks)
+                connection.writer.write = record(connection.writer.write,viewer_writes)
+            slow = connection
+            drain = slow.writer.drain
+            async def slow_drain():
+                await drain()
+                await asyncio.sleep(BROADCAST_SLOW_DRAIN)
+            slow.writer.drain = slow_drain
+
+            #--- Session, with a late viewer --------------------#
+            runtime = asyncio.create_task(SessionRuntime(Session(*BROADCAST_SESSION),server.renderer,audio = False).run())
+            await asyncio.sleep(BROADCAST_LATE_JOIN)
+            await connect(server,path,tasks)
+            await runtime
+            server.renderer.park()
+        finally:
+            await server.close()
+        outputs = await asyncio.wait_for(asyncio.gather(*tasks),DAEMON_TIMEOUT)
+        return server, slow, outputs
+
+    published, writes = [], ([],[])
+    with tempfile.TemporaryDirectory() as directory:
+        server, slow, outputs = asyncio.run(run(os.path.join(directory,"dab.sock"),published,writes))
+
+    #=== Final Screens ======================================#
+    expected = TerminalModel().feed(SESSION_START).feed(server.keyframe()).feed(SESSION_END)
+    for name, data in zip(("normal","slow","late"),outputs):
+        terminal = TerminalModel().feed(data)
+        if terminal.screen() != expected.screen() or terminal.cursor != expected.cursor:
+            raise Exception("{} viewer does not end on the final keyframe's screen.".format(name))
+    if not slow.dropped:
+        raise Exception("Slow viewer had no frames dropped.")
+
+    #=== Screens Along the Way ==============================#
+    terminal = TerminalModel().feed(SESSION_START)
+    screens = [terminal.feed(frame).screen() for frame in published]
+    for name, viewer_writes in zip(("normal","slow"),writes):
+        terminal = TerminalModel().feed(SESSION_START)
+        index = 0
+        for data in viewer_writes:
+            screen = terminal.feed(data).screen()
+            while index < len(screens) and screens[index] != screen:
+                index += 1
+            if index == len(screens):
+                raise Exception("{} viewer shows a screen the server never drew.".format(name))
+
+    sys.stdout.write("broadcast viewers stay in step ({} frames dropped for the slow one)\n".format(slow.dropped))
+
+def check_waveform_cache():
+    '''
+    Empties, then truncates, the file a WaveformCache keeps a beep in, and
+    checks a fresh cache still returns the synthesized waveform and leaves
+    a file the next one loads. Raises an Exception on the first mismatch.
+    '''
+    args = (550,0.05,5,60,0.3,SAMPLE_RATE,SAMPLE_DTYPE)
+    expected = synthesize_beep(*args)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = WaveformCache(directory)
+        cache.waveform(*args)
+        path = cache.path(tuple(cache.waveforms)[0])
+
+        for corruption in ("empty","truncated"):
+            size = os.path.getsize(path) // 2 if corruption == "truncated" else 0
+            with open(path,"r+b") as cache_file:
+                cache_file.truncate(size)
+
+            cache = WaveformCache(directory)
+            if not np.array_equal(cache.waveform(*args),expected) or cache.misses != 1:
+                raise Exception("WaveformCache did not synthesize over an {} file.".format(corruption))
+            cache = WaveformCache(directory)
+            if not np.array_equal(cache.waveform(*args),expected) or cache.hits != 1:
+                raise Exception("WaveformCache did not replace an {} file.".format(corruption))
+
+    sys.stdout.write("WaveformCache recovers from empty and truncated files\n")
+
+def check_governor():
+    '''
+    Runs a QualityGovernor on a SimClock against GOVERNOR_SLOW_COSTS, where
+    only dropping the expensive animation brings frames within budget, and
+    checks it steps down to the cheap animation and stays there. Then
+    checks it climbs back to full quality once frames get cheap
+    (GOVERNOR_FAST_COSTS). Raises an Exception on the first mismatch.
+    '''
+    clock = SimClock()
+    governor = QualityGovernor(clock = clock.time)
+
+    def run(costs):
+        for _ in range(GOVERNOR_FRAMES):
+            _, cheap, color = governor.quality
+            governor.start_frame()
+            clock.sleep(costs[2] if not color else costs[1] if cheap else costs[0])
+            governor.end_frame(HEAT_FRAMERATE)
+
+    run(GOVERNOR_SLOW_COSTS)
+    if governor.level != 3 or governor.changes != 3:
+        raise Exception("Governor at level {} after {} changes instead of level 3 after 3.".format(governor.level,governor.changes))
+    run(GOVERNOR_FAST_COSTS)
+    if governor.level != 0:
+        raise Exception("Governor did not recover full quality. (Level: {})".format(governor.level))
+
+    sys.stdout.write("governor holds the cheap animation and recovers ({} changes)\n".format(governor.changes))
+
+def check_prerender():
+    '''
+    Prerenders each of PRERENDER_SESSIONS split into chunks over
+    PRERENDER_WORKERS processes and in a single pass, and checks every
+    frame comes out byte for byte the same. Raises an Exception on the
+    first mismatch.
+    '''
+    frame_count = 0
+    for times in PRERENDER_SESSIONS:
+        single = prerender_session(Session(*times,art = ASCII_POT_LEAF),workers = 1)
+        chunked = prerender_session(Session(*times,art = ASCII_POT_LEAF),workers = PRERENDER_WORKERS)
+
+        if single.times != chunked.times or single.frame_count != chunked.frame_count:
+            raise Exception("Chunked prerender of {} has different frames.".format(times))
+        for index, (expected, frame) in enumerate(zip(single.frames,chunked.frames)):
+            if frame != expected:
+                raise Exception("Chunked prerender of {} differs at frame {} of {}.".format(times,index,single.frame_count))
+        frame_count += single.frame_count
+
+    sys.stdout.write("chunked prerender matches a single pass ({} frames)\n".format(frame_count))
+
+def check_simulated_sessions():
+    '''
+    Runs every session in SIMULATED_SESSIONS on virtual time, through both
+    SessionRuntime and sound_thread, and checks that each beep is played
+    exactly at its offset in the session's Timeline, that the first frame
+    of each phase is drawn on its start (and so with the beep marking
+    it), that no frame is dropped and that each session ends on time.
+    Beeps due after the end of a session are cut off with it. Raises an
+    Exception on the first mismatch.
+    '''
+    def on_time(played, expected):
+        return (len(played) == len(expected) and
+                all(abs(actual - offset) < SIMULATED_TOLERANCE for actual, offset in zip(played,expected)))
+
+    start = time.perf_counter()
+    session_time = 0
+    for times in SIMULATED_SESSIONS:
+        session = Session(*times)
+        beeps = session.beeps()
+        offsets = [offset for offset, _ in session.timeline.beeps()]
+        session_time += session.end_time
+
+        #--- Render loop and beep coroutine -----------------#
+        clock = SimClock()
+        played = []
+        drawn = []
+        runtime = SessionRuntime(session,NullRenderer(),
+                                 play = lambda *beep: played.append((clock.time() - runtime.scheduler.origin,beep)))
+        runtime.renderer.render = lambda frame: drawn.append(clock.time() - runtime.scheduler.origin)
+        run_simulated(runtime.run(),clock)
+
+        due = [offset for offset in offsets if offset <= session.end_time]
+        if not on_time([offset for offset, _ in played],due) or [beep for _, beep in played] != beeps[:len(due)]:
+            raise Exception("Beeps played off schedule. (Session: {})".format(times))
+        if len(drawn) != len(frame_times(session)) or runtime.scheduler.dropped:
+            raise Exception("{} frames drawn instead of {}. (Session: {})".format(len(drawn),len(frame_times(session)),times))
+        for offset, kind, phase in session.timeline.events:
+            if kind != PHASE_EVENT or offset >= session.end_time:
+                continue
+            first = next(frame_time for frame_time in drawn if session.phase(frame_time) == phase)
+            if abs(first - offset) >= SIMULATED_TOLERANCE:
+                raise Exception("{} first drawn at {:.3f} s instead of {} s. (Session: {})".format(phase,first,offset,times))
+        if not session.end_time <= runtime.scheduler.elapsed() < session.end_time + max(animation[4] for animation in PHASE_ANIMATIONS.values()):
+            raise Exception("Session ended at {:.3f} s instead of {} s. (Session: {})".format(runtime.scheduler.elapsed(),session.end_time,times))
+
+        #--- Beep thread ------------------------------------#
+        clock = SimClock()
+        played = []
+        sound_thread(beeps,lambda scheduled, actual: played.append((scheduled,actual)),clock.time,clock.sleep,lambda *beep: None)
+        if not on_time([scheduled for scheduled, _ in played],offsets) or not on_time([actual for _, actual in played],offsets):
+            raise Exception("sound_thread played beeps off schedule. (Session: {})".format(times))
+
+    sys.stdout.write("simulated {} sessions ({:.0f} s of session time) in {:.0f} ms\n".format(
+        len(SIMULATED_SESSIONS),session_time,(time.perf_counter() - start) * 1000))
+
+######################################################################################
+#                                                                    Animation bench #
+######################################################################################
+
+def bench_vert_lines():
+    '''
+    Times legacy_vert_lines against vert_lines on the DAB frame and prints
+    the time and output size of each.
+    '''
+    frame = dab_frame()
+    for name, func in (("legacy",legacy_vert_lines),("vert_lines",vert_lines)):
+        seconds = time_call(func,frame,7,COLORS_RAINBOW_16,True)
+        size = len(func(frame,7,COLORS_RAINBOW_16,True).encode())
+        sys.stdout.write("{:>10} {:>10.1f} us {:>8} bytes\n".format(name,seconds*1e6,size))
+
+######################################################################################
+#                                                                       Termio suite #
+######################################################################################
+
+def screen_text(cols, rows):
+    '''
+    Returns a cols x rows block of text made by tiling the pot-leaf art.
+    '''
+    art = ASCII_POT_LEAF.split("\n")
+    art_width = max(len(line) for line in art) + 1
+    return "\n".join((("".join(art[row % len(art)].ljust(art_width) for _ in range(cols // art_width + 1)))[:cols])
+                     for row in range(rows))
+
+def termio_cases():
+    '''
+    Returns a list of (name, func, args, kwargs) for every termio primitive,
+    first on the inputs dab.py actually draws and then on text filling each
+    of SCREEN_SIZES.
+    '''
+
+    #=== Realistic Inputs ===================================#
+    art_height = len(ASCII_POT_LEAF.split("\n"))
+    banner = make_banner(HEAT_TEXT,23,art_height)
+    frame = multi_line_join(ASCII_POT_LEAF,banner,ASCII_POT_LEAF,padding=2)
+
+    cases = [
+        ("make_banner/dab",     make_banner,     (HEAT_TEXT,23,art_height),                  {}),
+        ("multi_line_join/dab", multi_line_join, (ASCII_POT_LEAF,banner,ASCII_POT_LEAF),     {"padding":2}),
+        ("progress_bar/dab",    progress_bar,    (21,0.37),                                  {}),
+        ("pulse/dab",           pulse,           (frame,7,COLORS_RED),                       {}),
+        ("horiz_lines/dab",     horiz_lines,     (frame,7,COLORS_BLUE,True),                 {}),
+        ("vert_lines/dab",      vert_lines,      (frame,7,COLORS_RAINBOW_16,True),           {}),
+    ]
+
+    #=== Large Text =========================================#
+    import pyfiglet
+    glyphs = GlyphCache("big")
+    cases += [
+        ("figlet_format/countdown", pyfiglet.figlet_format, ("12.34",),  {"font":"big"}),
+        ("glyph_cache/countdown",   glyphs.render,          ("12.34",),  {}),
+    ]
+
+    #=== Scaled Inputs ======================================#
+    for cols, rows in SCREEN_SIZES:
+        size = "{}x{}".format(cols,rows)
+        text = screen_text(cols,rows)
+        half = screen_text(cols // 2 - 1,rows)
+        banner_text = "\n".join(["HEAT",progress_bar(cols - 4,0.37),"9.25"])
+
+        cases += [
+            ("make_banner/" + size,     make_banner,     (banner_text,cols,rows),  {}),
+            ("multi_line_join/" + size, multi_line_join, (half,half),              {"padding":2}),
+            ("progress_bar/" + size,    progress_bar,    (cols,0.37),              {}),
+            ("pulse/" + size,           pulse,           (text,7,COLORS_RED),      {}),
+            ("horiz_lines/" + size,     horiz_lines,     (text,7,COLORS_BLUE,True),{}),
+            ("vert_lines/" + size,      vert_lines,      (text,7,COLORS_RAINBOW_16,True),{}),
+        ]
+
+    return cases
+
+def measure_allocations(func, args, kwargs):
+    '''
+    Returns the peak number of bytes tracemalloc sees allocated during a
+    single func(*args, **kwargs) call.
+    '''
+    tracemalloc.start()
+    try:
+        base, _ = tracemalloc.get_traced_memory()
+        func(*args,**kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak - base
+
+def bench_termio():
+    '''
+    Parameters   :
+
+    Return Value : Dictionary mapping case name to its ns_per_op and
+                   alloc_bytes.
+
+    Description  :
+
+        Times every case from termio_cases and measures its allocations,
+        printing one row per case.
+
+    '''
+
+    #=== Initialize =========================================#
+    results = {}
+    sys.stdout.write("{:<24} {:>14} {:>12}\n".format("case","ns/op","alloc bytes"))
+
+    #=== Run Cases ==========================================#
+    for name, func, args, kwargs in termio_cases():
+        seconds = time_call(func,*args,**kwargs)
+        size = measure_allocations(func,args,kwargs)
+        results[name] = {"ns_per_op":seconds*1e9,"alloc_bytes":size}
+
+        sys.stdout.write("{:<24} {:>14.0f} {:>12}\n".format(name,seconds*1e9,size))
+
+    return results
+
+######################################################################################
+#                                                                            Results #
+######################################################################################
+
+def save_results(path, results):
+    '''
+    Writes benchmark results, with the interpreter they ran on, to a JSON file.
+    '''
+    with open(path,"w") as results_file:
+        json.dump({"python":platform.python_version(),"results":results},results_file,indent=2,sort_keys=True)
+
+def compare_results(baseline_path, results, threshold = REGRESSION_THRESHOLD):
+    '''
+    Parameters   :
+
+        baseline_path : Path of a JSON file written by save_results.
+
+        results       : Results of the current run.
+
+        threshold     : Fractional slowdown in ns_per_op counted as a
+                        regression. (Default 0.10, ie. 10%)
+
+    Return Value : List of the names of the cases that regressed.
+
+    Description  :
+
+        Prints the change in ns_per_op of every case present in both runs
+        and flags those that slowed down by more than threshold.
+
+    '''
+
+    #=== Initialize =========================================#
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+    regressions = []
+
+    #=== Compare ============================================#
+    sys.stdout.write("{:<24} {:>14} {:>14} {:>9}\n".format("case","baseline ns","current ns","change"))
+    for name in sorted(set(baseline) & set(results)):
+        before = baseline[name]["ns_per_op"]
+        after = results[name]["ns_per_op"]
+        change = after / before - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        sys.stdout.write("{:<24} {:>14.0f} {:>14.0f} {:>+8.1%}{}\n".format(name,before,after,change,flag))
+
+    return regressions
+
+######################################################################################
+#                                                                    Synthesis bench #
+######################################################################################
+
+def bench_synthesis():
+    '''
+    Parameters   :
+
+    Return Value : Dictionary mapping case name to its ns_per_op.
+
+    Description  :
+
+        Times the legacy np.append loop against synthesize_beep over a grid
+        of beep counts and durations, printing one row per grid point with
+        the largest difference between the two waveforms. Raises an
+        Exception if that is over SYNTHESIS_TOLERANCE.
+
+    '''
+
+    #=== Initialize =========================================#
+    results = {}
+    sys.stdout.write("{:>6} {:>10} {:>12} {:>12} {:>8} {:>10}\n".format("count","duration","legacy ms","vector ms","speedup","max error"))
+
+    #=== Run Grid ===========================================#
+    for count in BEEP_COUNTS:
+        for duration_s in BEEP_DURATIONS:
+            legacy_s = time_call(legacy_synthesize_beep,550,duration_s,count,60)
+            vector_s = time_call(synthesize_beep,550,duration_s,count,60,sample_rate = LEGACY_SAMPLE_RATE)
+            results["synthesize_beep/{}x{}".format(count,duration_s)] = {"ns_per_op":vector_s*1e9}
+
+            legacy = legacy_synthesize_beep(550,duration_s,count,60)
+            vector = synthesize_beep(550,duration_s,count,60,sample_rate = LEGACY_SAMPLE_RATE)
+            error = np.abs(legacy - vector).max() if len(legacy) == len(vector) else np.inf
+
+            sys.stdout.write("{:>6} {:>10} {:>12.3f} {:>12.3f} {:>7.1f}x {:>10.1e}\n".format(
+                count,duration_s,legacy_s*1000,vector_s*1000,legacy_s/vector_s,error))
+            if error > SYNTHESIS_TOLERANCE:
+                raise Exception("synthesize_beep differs from the legacy waveform by {}. (Count: {}) (Duration: {})".format(
+                    error,count,duration_s))
+
+    return results
+
+def bench_waveform_cache():
+    '''
+    Parameters   :
+
+    Return Value : Dictionary mapping case name to its ns_per_op.
+
+    Description  :
+
+        Times getting the waveform of each of a session's beeps three ways:
+        synthesizing it, loading it from a WaveformCache directory (memory
+        mapped) and looking it up once it has been loaded this run. Runs in
+        the fallback SAMPLE_RATE / SAMPLE_DTYPE, so no audio device is
+        needed.
+
+    '''
+
+    #=== Initialize =========================================#
+    results = {}
+    beeps = Session(25,25,8).beeps()[:3] # the last two repeat the third
+    sys.stdout.write("{:>22} {:>12} {:>12} {:>12}\n".format("beep","synth us","disk us","memory us"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        WaveformCache(directory).prepare(beeps,SAMPLE_RATE,SAMPLE_DTYPE)
+
+        #=== Run Beeps ==========================================#
+        for _, freq_hz, duration_s, count, step in beeps:
+            args = (freq_hz,duration_s,count,step,0.3,SAMPLE_RATE,SAMPLE_DTYPE)
+            warm = WaveformCache(directory)
+            warm.waveform(*args)
+
+            synth_s = time_call(synthesize_beep,*args)
+            disk_s = time_call(lambda: WaveformCache(directory).waveform(*args))
+            memory_s = time_call(warm.waveform,*args)
+
+            name = "{}hz x{} {}s".format(freq_hz,count,duration_s)
+            results["waveform_cache/" + name.replace(" ","_")] = {"ns_per_op":disk_s*1e9}
+            sys.stdout.write("{:>22} {:>12.1f} {:>12.1f} {:>12.2f}\n".format(name,synth_s*1e6,disk_s*1e6,memory_s*1e6))
+
+    return results
+
+##################################################################################################
+#                                                                                           MAIN #
+##################################################################################################
+
+if __name__ == "__main__":
+
+    #=== Parse Arguments ====================================#
+    parser = argparse.ArgumentParser(description = "Benchmarks for the dab timer's rendering and audio code.")
+    parser.add_argument("suites",nargs = "*",metavar = "SUITE",
+                        help = "suites to run, out of {} (default: all of them)".format(", ".join(SUITES)))
+    parser.add_argument("--save",metavar = "FILE",help = "write results to a JSON file")
+    parser.add_argument("--compare",metavar = "FILE",help = "compare against results saved with --save")
+    parser.add_argument("--threshold",type = float,default = REGRESSION_THRESHOLD,
+                        help = "slowdown counted as a regression (default: %(default)s)")
+    args = parser.parse_args()
+    for suite in args.suites: # not choices, argparse checks those against an empty list too
+        if suite not in SUITES:
+            parser.error("unknown suite {!r}".format(suite))
+    args.suites = args.suites or SUITES
+
+    #=== Run Suites =========================================#
+    results = {}
+    if "check" in args.suites:
+        check_vert_lines()
+        check_canvas()
+        check_diff_render()
+        check_canvas_allocations()
+        check_audio_format()
+        check_audio_engine()
+        check_waveform_cache()
+        check_prerender()
+        check_simulated_sessions()
+        check_governor()
+        check_daemon()
+        check_broadcast()
+        bench_vert_lines()
+    if "termio" in args.suites:
+        results.update(bench_termio())
+    if "synthesis" in args.suites:
+        results.update(bench_synthesis())
+        results.update(bench_waveform_cache())
+
+    #=== Save and Compare ===================================#
+    if args.save:
+        save_results(args.save,results)
+    if args.compare and compare_results(args.compare,results,args.threshold):
+        sys.exit(1)
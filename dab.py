@@ -4,14 +4,22 @@
 #                                                                                        IMPORTS #
 ##################################################################################################
 
-import time,sys,os
+import time,sys,os,asyncio,shutil
 
-from threading import Thread
+LAUNCH_TIME = time.perf_counter()
 
 from lib.termio import *
 from lib.sound_lib import *
+from lib.profiler import *
+from lib.session import *
+from lib.governor import QualityGovernor,NullGovernor
+from lib.runtime import SessionRuntime
+from lib.daemon import TimerDaemon,attach,DEFAULT_SOCKET
+from lib.recording import Recording,record_session,replay
+from lib.prerender import prerender_session
+from lib.broadcast import BroadcastServer,view
 
-from signal import SIGINT,signal
+IMPORT_TIME = time.perf_counter() - LAUNCH_TIME
 
 ##################################################################################################
 #                                                                             CONSTANTS / CONFIG #
@@ -23,33 +31,9 @@ from signal import SIGINT,signal
 
 std_print = sys.stdout.write
 
-#Art stuff
-HEAT_FRAMERATE = 1/30
-COOL_FRAMERATE = 1/30
-DAB_FRAMERATE  = 1/30
-
-HEAT_ANIMATION_SPEED = 1
-COOL_ANIMATION_SPEED = 0.5
-DAB_ANIMATION_SPEED  = 3
-
-HEAT_ANIMATION = "pulse"
-COOL_ANIMATION = "pulse"
-DAB_ANIMATION  = "vert"
-
-SECTION_PADDING = 2
-
-HEAT_MESSAGE = "HEAT"
-COOL_MESSAGE = "COOL"
-
-PROGRESS_BAR_WIDTH = 21
-
-BANNER_WIDTH = 23
-
-ROUNDING_PLACE = 2
-
-DAB_WORD_MAX_COLS = 4
-DAB_WORD_MAX_ROWS = 5
-DAB_MAX_WORDS = DAB_WORD_MAX_COLS * DAB_WORD_MAX_ROWS
+DIFF_RENDER = True # Only redraw the cells that changed since the last frame
+ADAPTIVE_QUALITY = True # Lower fps, then animation, then color when frames fall behind (turned off by -fixed)
+SYNC_UPDATES = True # Wrap each frame in synchronized update escapes so it is never shown half drawn (turned off by -nosync)
 
 #Timing stuff
 DEFAULT_HEAT = 25
@@ -58,15 +42,119 @@ DEFAULT_TIMEOUT = 8
 
 DEBUG = False
 
+PROFILE = False # Print per-stage frame timings at exit (also set by -profile)
+TRACE_FILE = None # Dump the per-frame trace here, .csv or .json (also set by -trace FILE)
+STARTUP = False # Print import and first frame latency at exit (also set by -startup)
+HEADLESS = False # Render to memory as fast as possible and report throughput (also set by -headless)
+HEADLESS_FRAMES = None # Frames to render headless, None for the whole session (also set by -frames N)
+DAEMON = False # Serve sessions to clients on SOCKET_PATH (also set by -daemon)
+ATTACH = False # Run the session on the daemon at SOCKET_PATH (also set by -attach)
+SOCKET_PATH = DEFAULT_SOCKET # (also set by -socket PATH, for -view also HOST:PORT)
+BROADCAST = False # Render once and send the frames to every viewer on SOCKET_PATH / BROADCAST_PORT (also set by -broadcast)
+BROADCAST_PORT = None # Also accept viewers on this localhost TCP port (also set by -port N)
+VIEW = False # Watch a broadcast at SOCKET_PATH (also set by -view)
+RECORD_FILE = None # Record the session to this file instead of showing it (also set by -record FILE)
+REPLAY_FILE = None # Play a recorded session back instead of rendering one (also set by -replay FILE)
+LARGE = False # Fill the terminal with figlet text instead of the art and banner (also set by -large)
+PRERENDER = False # Render every frame on all cores before starting, then only write them (also set by -prerender)
+PRERENDER_WORKERS = None # Worker processes for PRERENDER, None for one per core
+AUDIO_SAMPLE_RATE = None # Output sample rate, None for the device's own (also set by -rate HZ)
+AUDIO_DTYPE = None # Output sample format, e.g. "int16", None for the device's preferred (also set by -dtype TYPE)
+
 ######################################################################################
 #                                                       PARSE COMMAND LINE ARGUMENTS #
 ######################################################################################
 
 if __name__ == '__main__':
-    if '-nc' not in sys.argv:
-        std_print("\x1b[2J\x1b[H") # Clear terminal screen
-    else:
+    if '-headless' in sys.argv:
+        sys.argv.remove('-headless')
+        HEADLESS = True
+
+    if '-daemon' in sys.argv:
+        sys.argv.remove('-daemon')
+        DAEMON = True
+
+    if '-attach' in sys.argv:
+        sys.argv.remove('-attach')
+        ATTACH = True
+
+    if '-broadcast' in sys.argv:
+        sys.argv.remove('-broadcast')
+        BROADCAST = True
+
+    if '-view' in sys.argv:
+        sys.argv.remove('-view')
+        VIEW = True
+
+    if '-port' in sys.argv:
+        port_index = sys.argv.index('-port')
+        BROADCAST_PORT = int(sys.argv[port_index+1])
+        del sys.argv[port_index:port_index+2]
+
+    if '-socket' in sys.argv:
+        socket_index = sys.argv.index('-socket')
+        SOCKET_PATH = sys.argv[socket_index+1]
+        del sys.argv[socket_index:socket_index+2]
+
+    if '-record' in sys.argv:
+        record_index = sys.argv.index('-record')
+        RECORD_FILE = sys.argv[record_index+1]
+        del sys.argv[record_index:record_index+2]
+
+    if '-replay' in sys.argv:
+        replay_index = sys.argv.index('-replay')
+        REPLAY_FILE = sys.argv[replay_index+1]
+        del sys.argv[replay_index:replay_index+2]
+
+    if '-large' in sys.argv:
+        sys.argv.remove('-large')
+        LARGE = True
+
+    if '-prerender' in sys.argv:
+        sys.argv.remove('-prerender')
+        PRERENDER = True
+
+    if '-rate' in sys.argv:
+        rate_index = sys.argv.index('-rate')
+        AUDIO_SAMPLE_RATE = int(sys.argv[rate_index+1])
+        del sys.argv[rate_index:rate_index+2]
+
+    if '-dtype' in sys.argv:
+        dtype_index = sys.argv.index('-dtype')
+        AUDIO_DTYPE = sys.argv[dtype_index+1]
+        del sys.argv[dtype_index:dtype_index+2]
+
+    if '-frames' in sys.argv:
+        frames_index = sys.argv.index('-frames')
+        HEADLESS_FRAMES = int(sys.argv[frames_index+1])
+        del sys.argv[frames_index:frames_index+2]
+
+    if '-fixed' in sys.argv:
+        sys.argv.remove('-fixed')
+        ADAPTIVE_QUALITY = False
+
+    if '-nosync' in sys.argv:
+        sys.argv.remove('-nosync')
+        SYNC_UPDATES = False
+
+    if '-nc' in sys.argv:
         sys.argv.remove('-nc')
+    elif not (HEADLESS or DAEMON or RECORD_FILE or BROADCAST):
+        std_print("\x1b[2J\x1b[H") # Clear terminal screen
+
+    if '-profile' in sys.argv:
+        sys.argv.remove('-profile')
+        PROFILE = True
+
+    if '-startup' in sys.argv:
+        sys.argv.remove('-startup')
+        STARTUP = True
+
+    if '-trace' in sys.argv:
+        trace_index = sys.argv.index('-trace')
+        TRACE_FILE = sys.argv[trace_index+1]
+        del sys.argv[trace_index:trace_index+2]
+        PROFILE = True
 
 #--- Set heat and cool ----------------------------------#
 HEAT_TIME = int(sys.argv[1]) if len(sys.argv) >= 2 else DEFAULT_HEAT
@@ -74,33 +162,6 @@ COOL_TIME = int(sys.argv[2]) if len(sys.argv) >= 3 else DEFAULT_COOL
 TIMEOUT   = int(sys.argv[3]) if len(sys.argv) >= 4 else DEFAULT_TIMEOUT
 TOTAL_TIME = HEAT_TIME+COOL_TIME;
 
-######################################################################################
-#                                                                     Beep Sequences #
-######################################################################################
-
-BEEPS = [(0,350,0.05,7,60),
-        (HEAT_TIME,550,0.06,6,-75),
-        (COOL_TIME,550,0.05,5,60),
-        (1,550,0.05,5,60),
-        (1,550,0.05,5,60)]
-
-######################################################################################
-#                                                                          ASCII art #
-######################################################################################
-
-ASCII_POT_LEAF ="""        /\\
- |\\    /  \\    /|
- | \\   \\  /   / |
- |  |  \\  /  |  |
-  \\  \\ \\  / /  /
-|\\__\\ \\\\  // /__/|
- \\___--    --___/
-     /_/||\\_\\
-        ||"""
-
-
-ASCII_ART = [ASCII_POT_LEAF]
-
 ##################################################################################################
 #                                                                                           MAIN #
 ##################################################################################################
@@ -108,111 +169,116 @@ ASCII_ART = [ASCII_POT_LEAF]
 if __name__ == "__main__":
 
     #=== Initialize =========================================#
-    cur_time = 0
-    frame_num = 0
-    time_delta = 0
-    start_time = 0
+    first_frame_time = None
+    configure_audio(AUDIO_SAMPLE_RATE,AUDIO_DTYPE)
+    if LARGE:
+        cols, rows = shutil.get_terminal_size()
+        session = LargeSession(HEAT_TIME,COOL_TIME,TIMEOUT,cols,rows - 1) # keep the last row free so the frame never scrolls
+    else:
+        session = Session(HEAT_TIME,COOL_TIME,TIMEOUT)
+    profiler = FrameProfiler() if PROFILE else NullProfiler()
+    governor = QualityGovernor() if ADAPTIVE_QUALITY else NullGovernor()
+
+    #=== Headless run =======================================#
+    if HEADLESS:
+        stats = render_headless(session,HEADLESS_FRAMES,diff = DIFF_RENDER)
+        for phase in PHASES:
+            std_print("{:<5} {:>6} frames {:>10.1f} fps {:>8.0f} bytes/frame\n".format(
+                phase,stats[phase]["frames"],stats[phase]["fps"],stats[phase]["bytes_per_frame"]))
+        sys.exit()
 
-    #--- Prepare cursor for animation -----------------------#
-    carriage_return()
-    save_cursor()
+    #=== Record / replay ====================================#
+    if RECORD_FILE:
+        frames = record_session(session,RECORD_FILE,diff = DIFF_RENDER)
+        std_print("Recorded {} frames to {} ({} bytes)\n".format(frames,RECORD_FILE,os.path.getsize(RECORD_FILE)))
+        sys.exit()
 
-    #=== Start sound thread  ================================#
-    s_thread = Thread(target=sound_thread,args = [BEEPS])
-    s_thread.daemon = True
-    s_thread.start()
+    if REPLAY_FILE or PRERENDER:
+        output = TerminalOutput(synchronized = SYNC_UPDATES)
+        output.write(SESSION_START)
+        try:
+            if PRERENDER:
+                asyncio.run(replay(prerender_session(session,PRERENDER_WORKERS,diff = DIFF_RENDER),output.write))
+            else:
+                with Recording(REPLAY_FILE) as recording:
+                    asyncio.run(replay(recording,output.write))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            output.write(SESSION_END)
+        sys.exit()
 
-    def signal_handler(*args):
-        std_print(ESC+"[0m")
+    #=== Daemon / client ====================================#
+    if DAEMON:
+        try:
+            asyncio.run(TimerDaemon(SOCKET_PATH,defaults = (DEFAULT_HEAT,DEFAULT_COOL,DEFAULT_TIMEOUT)).serve_forever())
+        except KeyboardInterrupt:
+            pass
         sys.exit()
 
-    signal(SIGINT,signal_handler)
-    #=== Run animation loop  ================================#
+    if BROADCAST:
+        async def broadcast():
+            server = await BroadcastServer(SOCKET_PATH,BROADCAST_PORT,diff = DIFF_RENDER).start()
+            try:
+                await SessionRuntime(session,server.renderer,profiler,handle_signals = True).run()
+                server.renderer.park()
+            finally:
+                await server.close()
+
+        std_print("Broadcasting on {}{}\n".format(SOCKET_PATH," and port {}".format(BROADCAST_PORT) if BROADCAST_PORT else ""))
+        asyncio.run(broadcast())
+        sys.exit()
 
-    #___ Select ASCII art ____________________________#
-    art_selection = random.choice(ASCII_ART)
-    art_height = len(art_selection.split("\n"))
-    disable_cursor()
+    if VIEW:
+        try:
+            view(SOCKET_PATH)
+        except KeyboardInterrupt:
+            std_print(ESC+"[0m"+ESC+"[?25h\n")
+        sys.exit()
 
-    try:
-        while(cur_time < TOTAL_TIME + TIMEOUT):
-            # TODO: Split this into 3 blocks for heating, cooling, and post
-            #
-            # *Frame init*
-            # --create text
-            # --set animation
-            # *frame draw*
-            # --sleep for given framerate
-
-            #--- Initialize Frame -------------------------------#
-            restore_cursor()
-            cur_time += time_delta
-            start_time = time.time()
-
-            #--- Create Frame -----------------------------------#
-
-            #___ Create Text ____________________________#
-            frame_text = ""
-            if (cur_time < HEAT_TIME):
-                frame_text += "\n"
-                frame_text += HEAT_MESSAGE + "\n"*2
-                frame_text += progress_bar(width = PROGRESS_BAR_WIDTH, progress = min(cur_time/HEAT_TIME,1)) +"\n"
-                frame_text += "\n"
-                frame_text += "{:<6}".format(str(round(cur_time,ROUNDING_PLACE)))
-
-            elif(cur_time < TOTAL_TIME):
-                frame_text += "\n"
-                frame_text += COOL_MESSAGE + "\n"*2
-                frame_text += progress_bar(width = PROGRESS_BAR_WIDTH, progress = min(max(cur_time-HEAT_TIME,0)/COOL_TIME,1),inverted = True) +"\n"
-                frame_text += "\n"
-                frame_text += "{:<6}".format(str(round(TOTAL_TIME - cur_time,ROUNDING_PLACE)))
+    if ATTACH:
+        try:
+            attach(SOCKET_PATH,(HEAT_TIME,COOL_TIME,TIMEOUT))
+        except KeyboardInterrupt:
+            std_print(ESC+"[0m"+ESC+"[?25h\n")
+        sys.exit()
 
-            else:
-                frame_text += "\n"
-                timeout_elapsed = cur_time - TOTAL_TIME
-                timeout_percent = min(timeout_elapsed / 3,1)
-                num_dab_words = max(1,int(timeout_percent * DAB_MAX_WORDS))
-
-                while(num_dab_words > 0):
-                    for _ in range(min(num_dab_words, DAB_WORD_MAX_COLS)):
-                        frame_text += "DAB! "
-                        num_dab_words -= 1
-
-                    frame_text += "\n"
-
-
-            #___ Make Banner ____________________________________#
-            banner = make_banner(frame_text,BANNER_WIDTH,art_height)
-
-            #--- Draw Frame -------------------------------------#
-            frame = multi_line_join(*[art_selection,banner,art_selection],padding=SECTION_PADDING)
-            if (cur_time < HEAT_TIME):
-                animated_frame = pulse(frame,int(frame_num * HEAT_ANIMATION_SPEED),COLORS_RED)
-                framerate = HEAT_FRAMERATE
-            elif(cur_time < TOTAL_TIME):
-                animated_frame = horiz_lines(frame,int(frame_num * COOL_ANIMATION_SPEED),COLORS_BLUE,inverted = True)
-                framerate = COOL_FRAMERATE
-            else:
-                animated_frame = vert_lines(frame,int(frame_num * DAB_ANIMATION_SPEED),COLORS_RAINBOW_16,inverted = True)
-                framerate = DAB_FRAMERATE
-            if(DEBUG):
-                print("FRAME:",frame_num)
-                print("COLORS:",COLORS_TEST)
-            std_print(animated_frame)
+    #--- Prepare cursor for animation -----------------------#
+    # Every frame goes out as encoded bytes in a single os.write
+    output = TerminalOutput(synchronized = SYNC_UPDATES)
+    output.write(SESSION_START)
+    renderer = FrameRenderer(output.write,diff = DIFF_RENDER,binary = True)
+
+    def mark_first_frame():
+        global first_frame_time
+        first_frame_time = time.perf_counter() - LAUNCH_TIME
 
-            #--- Sleep until frame refresh ----------------------#
-            time.sleep(max(0,(framerate - (time.time()-start_time))))
-            time_delta = time.time() - start_time
-            frame_num += 1
+    runtime = SessionRuntime(session,renderer,profiler,handle_signals = True,on_first_frame = mark_first_frame,governor = governor)
 
+    #=== Run animation loop  ================================#
+    # Frames and beeps run as coroutines on one event loop. Ctrl-C cancels
+    # them and falls through to the cleanup below.
+    try:
+        asyncio.run(runtime.run())
 
     #--- Clear and print on error ---------------------------#
     except Exception as e:
         std_print(str(e)+"\n")
     finally:
-        reset_color()
-        enable_cursor()
-        std_print("\n")
+        renderer.park()
+        output.write(SESSION_END)
+        if(DEBUG and runtime.scheduler is not None):
+            std_print("BYTES PER FRAME: {:.0f}\n".format(renderer.total_bytes / max(1,renderer.frames)))
+            std_print("WRITES PER FRAME: {:.2f}\n".format(output.writes / max(1,renderer.frames)))
+            std_print("FPS: {:.1f} ({} dropped)\n".format(runtime.scheduler.fps(),runtime.scheduler.dropped))
+            std_print("ANIMATION CACHE: {} hits, {} misses\n".format(session.animation_cache.hits,session.animation_cache.misses))
+            std_print("QUALITY: level {} (lowest {}, {} changes)\n".format(governor.level,governor.lowest,governor.changes))
+        if(STARTUP and first_frame_time is not None):
+            std_print("STARTUP: imports {:.1f} ms, first frame {:.1f} ms\n".format(IMPORT_TIME*1000,first_frame_time*1000))
+        if(PROFILE):
+            std_print(profiler.summary())
+        if(TRACE_FILE):
+            profiler.dump(TRACE_FILE)
         exit()
 
 
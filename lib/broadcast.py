@@ -0,0 +1,216 @@
+################################### IMPORTS ####################################
+
+import asyncio,os,socket,sys
+
+from lib.termio import *
+
+################################## CONSTANTS ###################################
+
+BROADCAST_QUEUE_SIZE = 8 # frames a viewer may fall behind before frames are dropped
+BROADCAST_CLOSE_TIMEOUT = 2 # seconds viewers get to receive the end of the session
+
+################################### CLASSES ####################################
+
+class Viewer:
+    '''
+    Parameters   :
+
+        writer     : StreamWriter of the viewer's connection.
+
+        queue_size : Number of frames that may wait to be sent.
+
+    Description  :
+
+        One connected viewer: a bounded queue of encoded frames and the
+        task sending them. A viewer that falls behind by a full queue has
+        its waiting frames dropped and is sent a keyframe instead, so it
+        skips ahead to the current frame without holding anyone else up.
+
+    '''
+
+    def __init__(self, writer, queue_size = BROADCAST_QUEUE_SIZE):
+        self.writer         = writer
+        self.queue          = asyncio.Queue(max(2,queue_size))
+        self.needs_keyframe = True # a new viewer starts with a keyframe
+        self.sent           = 0
+        self.dropped        = 0
+
+    def offer(self, frame, keyframe):
+        '''
+        Queues frame (bytes) for sending, or keyframe() in its place if the
+        viewer is out of step. Never waits.
+        '''
+        if not self.needs_keyframe:
+            try:
+                self.queue.put_nowait(frame)
+                return
+            except asyncio.QueueFull:
+                while not self.queue.empty():
+                    self.queue.get_nowait()
+                    self.dropped += 1
+
+        self.needs_keyframe = False
+        self.queue.put_nowait(keyframe())
+
+    def finish(self, keyframe):
+        '''
+        Queues the end of the session, after which send returns.
+        '''
+        ending = SESSION_END.encode()
+        if self.needs_keyframe or self.queue.maxsize - self.queue.qsize() < 2:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            ending = keyframe() + ending
+        self.queue.put_nowait(ending)
+        self.queue.put_nowait(None)
+
+    async def send(self):
+        '''
+        Sends queued frames until the connection closes. None ends it.
+        '''
+        while True:
+            frame = await self.queue.get()
+            if frame is None:
+                break
+            self.writer.write(frame)
+            await self.writer.drain()
+            self.sent += 1
+
+class BroadcastServer:
+    '''
+    Parameters   :
+
+        path       : Unix socket path to listen on, or None.
+
+        port       : TCP port to listen on (localhost only), or None.
+
+        queue_size : Frames each viewer may fall behind, see Viewer.
+
+        diff       : Passed on to FrameRenderer.
+
+    Description  :
+
+        Shows one render loop on any number of screens. renderer is a
+        FrameRenderer whose output goes to publish instead of a terminal,
+        so a session is rendered once whatever the number of viewers, and
+        each frame is encoded once and handed to every viewer's queue.
+        Viewers can connect at any time. Each is sent the renderer's
+        keyframe first (and again after falling behind), so it only ever
+        costs a socket write.
+
+    '''
+
+    def __init__(self, path = None, port = None, queue_size = BROADCAST_QUEUE_SIZE, diff = True):
+        self.path       = path
+        self.port       = port
+        self.queue_size = queue_size
+        self.renderer   = FrameRenderer(self.publish,diff = diff,binary = True)
+        self.servers    = []
+        self.viewers    = {} # viewer -> task sending to it
+        self.frames     = 0
+
+        self._keyframe  = None # keyframe of the current frame, built on first request
+
+    async def start(self):
+        '''
+        Starts listening on the Unix socket and/or TCP port.
+        '''
+        if self.path is not None:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self.servers.append(await asyncio.start_unix_server(self._handle_viewer,path = self.path))
+        if self.port is not None:
+            self.servers.append(await asyncio.start_server(self._handle_viewer,"127.0.0.1",self.port))
+        return self
+
+    async def close(self):
+        '''
+        Stops accepting viewers, then sends every viewer the end of the
+        session and waits (up to BROADCAST_CLOSE_TIMEOUT) for it to go out.
+        '''
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+        self.servers = []
+
+        #=== End Viewers ========================================#
+        for viewer in self.viewers:
+            viewer.finish(self.keyframe)
+        if self.viewers:
+            _, pending = await asyncio.wait(list(self.viewers.values()),timeout = BROADCAST_CLOSE_TIMEOUT)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending,return_exceptions = True)
+
+        if self.path is not None and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def publish(self, frame):
+        '''
+        FrameRenderer write target. Offers the encoded frame to every viewer.
+        '''
+        self._keyframe = None
+        self.frames += 1
+        for viewer in self.viewers:
+            viewer.offer(frame,self.keyframe)
+
+    def keyframe(self):
+        '''
+        Returns the renderer's keyframe for the current frame, encoded.
+        '''
+        if self._keyframe is None:
+            self._keyframe = self.renderer.keyframe().encode()
+        return self._keyframe
+
+    async def _handle_viewer(self, reader, writer):
+        '''
+        Sends a new viewer frames until the session ends or it disconnects.
+        '''
+        viewer = Viewer(writer,self.queue_size)
+        writer.write(SESSION_START.encode())
+        if self.renderer.frames:
+            viewer.offer(None,self.keyframe) # needs_keyframe is set, so this sends the keyframe
+        self.viewers[viewer] = asyncio.current_task()
+
+        try:
+            await viewer.send()
+        except (ConnectionError,asyncio.CancelledError):
+            pass
+        finally:
+            self.viewers.pop(viewer,None)
+            writer.close()
+
+################################## FUNCTIONS ###################################
+
+def view(address, output = None):
+    '''
+    Parameters   :
+
+        address : Unix socket path, or "host:port" for TCP.
+
+        output  : Binary file the frames are copied to.
+                  (Default: sys.stdout.buffer)
+
+    Description  :
+
+        Client side of BroadcastServer. Copies what the server sends to
+        output until the session ends.
+
+    '''
+    output = output or sys.stdout.buffer
+
+    if ":" in address:
+        host, port = address.rsplit(":",1)
+        client = socket.create_connection((host,int(port)))
+    else:
+        client = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+        client.connect(address)
+
+    with client:
+        while True:
+            data = client.recv(65536)
+            if not data:
+                break
+            output.write(data)
+            output.flush()
@@ -0,0 +1,157 @@
+################################### IMPORTS ####################################
+
+import asyncio,os,socket,sys
+
+from lib.termio import *
+from lib.session import Session
+from lib.runtime import SessionRuntime
+from lib.governor import QualityGovernor
+from lib.sound_lib import get_engine
+
+################################## CONSTANTS ###################################
+
+DEFAULT_SOCKET = "/tmp/dab.sock"
+
+################################### CLASSES ####################################
+
+class TimerDaemon:
+    '''
+    Parameters   :
+
+        path  : Path of the Unix socket to listen on.
+
+        audio : If True, beeps of every session are played through the
+                shared AudioEngine. If False (or no output device can be
+                opened) sessions run silently.
+
+        defaults : (heat, cool, timeout) used for values a client leaves out.
+
+    Description  :
+
+        Runs any number of heat/cool/timeout sessions from a single asyncio
+        event loop. Each client connects, sends one line of up to three
+        integers ("heat cool timeout", missing values use the defaults),
+        and receives that session's frames until it ends. All sessions
+        share one animation cache and one audio mixer, so each extra timer
+        only costs its own frame rendering. Each session has its own
+        QualityGovernor, so a client on a slow link gets fewer and simpler
+        frames instead of falling behind.
+
+    '''
+
+    def __init__(self, path = DEFAULT_SOCKET, audio = True, defaults = (25,25,8)):
+        self.path     = path
+        self.audio    = audio
+        self.defaults = defaults
+        self.server   = None
+        self.sessions = set() # tasks of the sessions currently running
+
+        self.animation_cache = AnimationCache()
+
+    async def start(self):
+        '''
+        Starts listening on the socket, replacing any stale socket file.
+        '''
+        if self.audio:
+            try:
+                get_engine()
+            except Exception:
+                self.audio = False
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self._handle_client,path = self.path)
+        return self
+
+    async def close(self):
+        '''
+        Stops listening and cancels every running session.
+        '''
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+        for task in list(self.sessions):
+            task.cancel()
+        await asyncio.gather(*self.sessions,return_exceptions = True)
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.close()
+
+    async def _handle_client(self, reader, writer):
+        '''
+        Reads the session request from a new client and runs its session.
+        '''
+
+        #=== Initialize =========================================#
+        self.sessions.add(asyncio.current_task())
+
+        try:
+            #--- Parse request ----------------------------------#
+            request = (await reader.readline()).decode().split()
+            times = [int(value) for value in request[:3]]
+            heat_time, cool_time, timeout = times + list(self.defaults[len(times):])
+
+            session = Session(heat_time,cool_time,timeout,animation_cache = self.animation_cache)
+
+            #=== Run Session ====================================#
+            renderer = FrameRenderer(writer.write,binary = True)
+            writer.write(SESSION_START.encode())
+
+            await SessionRuntime(session,renderer,audio = self.audio,flush = writer.drain,governor = QualityGovernor()).run()
+
+            renderer.park()
+            writer.write(SESSION_END.encode())
+            await writer.drain()
+
+        except (ValueError,ConnectionError):
+            pass
+
+        except asyncio.CancelledError:
+            # Daemon shutting down. Returning normally keeps asyncio's stream
+            # machinery from reporting the cancelled handler as an error.
+            pass
+
+        finally:
+            writer.close()
+            self.sessions.discard(asyncio.current_task())
+
+################################## FUNCTIONS ###################################
+
+def attach(path = DEFAULT_SOCKET, times = (), output = None):
+    '''
+    Parameters   :
+
+        path   : Path of the daemon's socket.
+
+        times  : Up to three integers, the heat, cool and timeout lengths.
+
+        output : Binary file the session is copied to.
+                 (Default: sys.stdout.buffer)
+
+    Description  :
+
+        Client side of TimerDaemon. Requests a session and copies what the
+        daemon sends to output until the session ends.
+
+    '''
+    output = output or sys.stdout.buffer
+
+    with socket.socket(socket.AF_UNIX,socket.SOCK_STREAM) as client:
+        client.connect(path)
+        client.sendall((" ".join(str(value) for value in times) + "\n").encode())
+
+        while True:
+            data = client.recv(65536)
+            if not data:
+                break
+            output.write(data)
+            output.flush()
@@ -0,0 +1,129 @@
+################################### IMPORTS ####################################
+
+import time
+
+################################## CONSTANTS ###################################
+
+# (frame period multiplier, cheap animation, color) of each quality level,
+# from full quality down
+QUALITY_LEVELS = [(1,False,True),
+                  (2,False,True),
+                  (3,False,True),
+                  (3,True, True),
+                  (3,True, False)]
+
+FULL_QUALITY = QUALITY_LEVELS[0]
+
+STEP_DOWN_LOAD = 0.8  # step down once frames take this much of their period
+STEP_UP_LOAD   = 0.4  # step up once frames would take this little of the next level's period
+SMOOTHING      = 0.2  # weight of the newest frame in the average frame cost
+SETTLE_FRAMES  = 15   # frames to wait after a change before deciding again
+
+################################### GLOBALS ####################################
+
+################################### CLASSES ####################################
+
+class QualityGovernor:
+    '''
+    Parameters   :
+
+        levels : List of (period multiplier, cheap animation, color) tuples,
+                 best quality first. (Default: QUALITY_LEVELS)
+
+        clock  : Callable returning monotonic seconds. (Default: time.perf_counter)
+
+    Description  :
+
+        Keeps frames within their budget on slow hardware or slow terminals.
+        The time from start_frame to end_frame (rendering plus writing,
+        including any time spent blocked on the terminal) is averaged and
+        compared to the frame period. When it takes up too much of the
+        period the governor steps down a level: first fewer frames per
+        second, then a cheaper animation, then no color at all. When the
+        cost would fit easily in the period of the level above, it steps
+        back up.
+
+        The cost at the level above is predicted from the current cost
+        times how much more that level cost than this one when it was last
+        left. Lower frame rates cost the same per frame, but a cheaper
+        animation or no color can be many times cheaper, so without this a
+        governor that stepped down for an expensive animation would see the
+        cheap frames fit and step straight back up.
+
+        Use NullGovernor, which always returns FULL_QUALITY, to turn this off.
+
+    '''
+
+    def __init__(self, levels = QUALITY_LEVELS, clock = time.perf_counter):
+        self.levels  = levels
+        self.clock   = clock
+        self.level   = 0
+        self.quality = levels[0]
+        self.cost    = None # average seconds per frame
+        self.lowest  = 0    # lowest quality level reached
+        self.changes = 0
+        self.ratios  = [1] * len(levels) # cost of each level relative to the one below, as last measured
+
+        self._start  = 0
+        self._settle = SETTLE_FRAMES
+        self._left   = None # (level, average cost) of the level just stepped down from
+
+    def start_frame(self):
+        self._start = self.clock()
+
+    def end_frame(self, framerate):
+        '''
+        Parameters   :
+
+            framerate : The frame's full quality period, in seconds.
+
+        Return Value : Quality tuple to draw the next frame with.
+
+        '''
+
+        #=== Measure ============================================#
+        cost = self.clock() - self._start
+        self.cost = cost if self.cost is None else self.cost + SMOOTHING * (cost - self.cost)
+
+        if self._settle > 0:
+            self._settle -= 1
+            return self.quality
+
+        #--- Settled after stepping down, compare the costs -#
+        if self._left is not None:
+            level, cost = self._left
+            self.ratios[level] = cost / self.cost if self.cost > 0 else 1
+            self._left = None
+
+        #=== Step ===============================================#
+        if self.level < len(self.levels) - 1 and self.cost > STEP_DOWN_LOAD * framerate * self.quality[0]:
+            self._left = (self.level,self.cost)
+            self._set_level(self.level + 1)
+        elif self.level > 0 and self.cost * self.ratios[self.level - 1] < STEP_UP_LOAD * framerate * self.levels[self.level - 1][0]:
+            self._set_level(self.level - 1)
+
+        return self.quality
+
+    def _set_level(self, level):
+        self.level   = level
+        self.quality = self.levels[level]
+        self.lowest  = max(self.lowest,level)
+        self.changes += 1
+        self._settle = SETTLE_FRAMES
+
+class NullGovernor:
+    '''
+    QualityGovernor that keeps full quality.
+    '''
+    level   = 0
+    quality = FULL_QUALITY
+    lowest  = 0
+    changes = 0
+
+    def start_frame(self):
+        pass
+
+    def end_frame(self, framerate):
+        return FULL_QUALITY
+
+################################## FUNCTIONS ###################################
@@ -0,0 +1,154 @@
+################################### IMPORTS ####################################
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from lib.termio import *
+from lib.session import PHASE_ANIMATIONS
+
+################################## CONSTANTS ###################################
+
+CHUNKS_PER_WORKER = 2
+
+################################### GLOBALS ####################################
+
+################################### CLASSES ####################################
+
+class PrerenderedSession:
+    '''
+    Parameters   :
+
+        times  : Time, in seconds from the start, each frame is due.
+
+        frames : Encoded bytes of each frame, as FrameRenderer writes them.
+
+        beeps  : Beep list, as for sound_thread.
+
+        end_time : Length of the session in seconds.
+
+    Description  :
+
+        Every frame of a session, already rendered. Has the same interface
+        as Recording, so replay plays it the same way.
+
+    '''
+
+    def __init__(self, times, frames, beeps, end_time):
+        self.times       = times
+        self.frames      = frames
+        self.beeps       = beeps
+        self.end_time    = end_time
+        self.frame_count = len(frames)
+
+    def time(self, index):
+        return self.times[index]
+
+    def frame(self, index):
+        return self.frames[index]
+
+################################## FUNCTIONS ###################################
+
+def frame_times(session):
+    '''
+    Returns the time of every frame of the session, with time advancing one
+    frame period per frame as in render_headless (see Timeline.frame_after).
+    '''
+    times = []
+    cur_time = 0
+    while cur_time < session.end_time:
+        times.append(cur_time)
+        cur_time = session.timeline.frame_after(cur_time,PHASE_ANIMATIONS[session.phase(cur_time)][4])
+    return times
+
+def render_chunk(session, times, start, stop, diff = True):
+    '''
+    Parameters   :
+
+        session     : Session to render. Worker processes get a fresh copy.
+
+        times       : Time of every frame of the session (from frame_times).
+
+        start, stop : Range of frames to render.
+
+        diff        : Passed on to FrameRenderer.
+
+    Return Value : List of the encoded bytes of frames start to stop.
+
+    Description  :
+
+        Worker side of prerender_session. Renders one contiguous range of
+        frames. The frame before the range is
+        rendered first and thrown away, so the first frame of the range is
+        encoded as changes against it, exactly as in a single pass.
+
+    '''
+
+    #=== Initialize =========================================#
+    output = []
+    renderer = FrameRenderer(output.append,diff = diff,binary = True)
+
+    #=== Render Frames ======================================#
+    frames = []
+    for frame_num in range(max(0,start - 1),stop):
+        animated_frame, _ = session.render(times[frame_num],frame_num)
+        renderer.render(animated_frame)
+        if frame_num >= start:
+            frames.append(b"".join(output))
+        output.clear()
+
+    #--- Leave the cursor where a live session would ----#
+    if stop == len(times):
+        renderer.park()
+        frames.append(b"".join(output))
+
+    return frames
+
+def prerender_session(session, workers = None, diff = True):
+    '''
+    Parameters   :
+
+        session : Session to render.
+
+        workers : Number of worker processes. (Default: os.cpu_count())
+                  1 renders in this process.
+
+        diff    : Passed on to FrameRenderer.
+
+    Return Value : PrerenderedSession holding every frame.
+
+    Description  :
+
+        Every frame's time, and so its content, is known before a session
+        starts. The frame range is split into contiguous chunks that are
+        rendered in parallel on a ProcessPoolExecutor, so the live loop is
+        left with nothing to do but write the finished bytes at each
+        frame's time. Falls back to rendering in this process if worker
+        processes cannot be started.
+
+    '''
+
+    #=== Initialize =========================================#
+    workers = workers or os.cpu_count() or 1
+    times = frame_times(session)
+    args = (session,times)
+
+    chunk_count = min(len(times),workers * CHUNKS_PER_WORKER) if workers > 1 else 1
+    edges = [len(times) * chunk // chunk_count for chunk in range(chunk_count + 1)]
+
+    #=== Render Chunks ======================================#
+    chunks = None
+    if chunk_count > 1:
+        try:
+            with ProcessPoolExecutor(max_workers = workers) as executor:
+                futures = [executor.submit(render_chunk,*args,start,stop,diff) for start, stop in zip(edges,edges[1:])]
+                chunks = [future.result() for future in futures]
+        except (OSError,NotImplementedError,BrokenProcessPool):
+            chunks = None
+
+    if chunks is None:
+        chunks = [render_chunk(*args,0,len(times),diff)]
+
+    #=== Combine ============================================#
+    frames = [frame for chunk in chunks for frame in chunk]
+    return PrerenderedSession(times + [session.end_time],frames,session.beeps(),session.end_time)
@@ -0,0 +1,130 @@
+################################### IMPORTS ####################################
+
+import time
+
+################################## CONSTANTS ###################################
+
+PERCENTILES = [50,90,99,100]
+
+################################### GLOBALS ####################################
+
+################################### CLASSES ####################################
+
+class FrameProfiler:
+    '''
+    Parameters   :
+
+        clock : Callable returning monotonic seconds. (Default: time.perf_counter)
+
+    Description  :
+
+        Records how long each stage of every frame takes. A frame starts with
+        start_frame, each call to mark closes the stage of the given name
+        (measured from the previous mark), and end_frame stores it along with
+        the number of bytes written. Beep onsets are recorded separately with
+        record_beep.
+
+        Use NullProfiler, which has the same methods doing nothing, when
+        profiling is off.
+
+    '''
+
+    def __init__(self, clock = time.perf_counter):
+        self.clock  = clock
+        self.stages = []  # stage names in the order they were first marked
+        self.frames = []  # one dictionary per frame
+        self.beeps  = []  # (scheduled, actual) offsets in seconds
+
+        self._frame = None
+        self._last  = 0
+
+    def start_frame(self, scheduled, actual):
+        '''
+        Starts a frame due at scheduled seconds into the session whose loop
+        actually woke up at actual seconds.
+        '''
+        self._frame = {"scheduled":scheduled,"actual":actual,"late":actual - scheduled}
+        self._last  = self.clock()
+
+    def mark(self, stage):
+        '''
+        Ends the named stage of the current frame.
+        '''
+        now = self.clock()
+        self._frame[stage] = self._frame.get(stage,0) + now - self._last
+        self._last = now
+        if stage not in self.stages:
+            self.stages.append(stage)
+
+    def end_frame(self, bytes_written):
+        self._frame["bytes"] = bytes_written
+        self.frames.append(self._frame)
+        self._frame = None
+
+    def record_beep(self, scheduled, actual):
+        '''
+        Records a beep due at scheduled seconds that started at actual seconds.
+        '''
+        self.beeps.append((scheduled,actual))
+
+    def summary(self):
+        '''
+        Returns a printable table of percentiles for every stage, the frame
+        wake-up lateness, bytes per frame and beep onset error.
+        '''
+
+        #=== Initialize =========================================#
+        header = "{:<10}".format("") + "".join("{:>10}".format("p{}".format(p) if p < 100 else "max") for p in PERCENTILES)
+        lines = ["{} frames".format(len(self.frames)),header]
+
+        def add_row(name, values, scale, unit):
+            row = "{:<10}".format(name)
+            row += "".join("{:>10}".format("{:.2f}".format(value * scale)) for value in percentiles(values))
+            lines.append(row + " " + unit)
+
+        #=== Build Rows =========================================#
+        for stage in self.stages:
+            add_row(stage,[frame.get(stage,0) for frame in self.frames],1000,"ms")
+        add_row("late",[frame["late"] for frame in self.frames],1000,"ms")
+        add_row("bytes",[frame["bytes"] for frame in self.frames],1,"B")
+        if self.beeps:
+            add_row("beep",[actual - scheduled for scheduled, actual in self.beeps],1000,"ms")
+
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        '''
+        Writes the per frame trace to path, as CSV if it ends in .csv and as
+        JSON otherwise.
+        '''
+        import json,csv
+
+        columns = ["scheduled","actual","late"] + self.stages + ["bytes"]
+
+        with open(path,"w",newline = "") as trace_file:
+            if path.endswith(".csv"):
+                writer = csv.DictWriter(trace_file,fieldnames = columns,restval = 0)
+                writer.writeheader()
+                writer.writerows(self.frames)
+            else:
+                json.dump({"frames":self.frames,"beeps":self.beeps},trace_file)
+
+class NullProfiler:
+    '''
+    Stand-in for FrameProfiler when profiling is off. Every method does nothing.
+    '''
+    def start_frame(self, scheduled, actual): pass
+    def mark(self, stage): pass
+    def end_frame(self, bytes_written): pass
+    def record_beep(self, scheduled, actual): pass
+
+################################## FUNCTIONS ###################################
+
+def percentiles(values, points = PERCENTILES):
+    '''
+    Returns the nearest-rank percentiles of values for each of points.
+    '''
+    if not values:
+        return [0 for _ in points]
+    ordered = sorted(values)
+    return [ordered[min(len(ordered) - 1, max(0, -(-point * len(ordered) // 100) - 1))] for point in points]
@@ -0,0 +1,181 @@
+################################### IMPORTS ####################################
+
+import asyncio,mmap,struct
+
+from lib.termio import *
+from lib.runtime import play_beeps
+from lib.timeline import beep_schedule
+
+################################## CONSTANTS ###################################
+
+# The last two bytes are the format version, bumped when the frames written
+# change (version 1 frames lose their colors after an ESC 8 move)
+RECORDING_MAGIC = b"DABREC\x00\x02"
+
+# File layout: header, beep table, frame index, frame data
+RECORDING_HEADER = struct.Struct("<8sIId") # magic, frame count, beep count, end time
+RECORDING_BEEP   = struct.Struct("<dddii") # delay, frequency, duration, count, step
+RECORDING_FRAME  = struct.Struct("<dQI")   # time, data offset, data length
+
+################################### GLOBALS ####################################
+
+################################### CLASSES ####################################
+
+class Recording:
+    '''
+    Parameters   :
+
+        path : Recording file written by record_session.
+
+    Description  :
+
+        Read only view of a recording. The file is memory mapped and
+        nothing is decoded up front: frame returns a memoryview straight
+        into the mapping, ready to be written to the terminal as is.
+        Frames must not be used after close.
+
+    '''
+
+    def __init__(self, path):
+        with open(path,"rb") as recording_file:
+            self._map = mmap.mmap(recording_file.fileno(),0,access = mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+        magic, self.frame_count, beep_count, self.end_time = RECORDING_HEADER.unpack_from(self._map,0)
+        if magic != RECORDING_MAGIC:
+            self.close()
+            if magic[:6] == RECORDING_MAGIC[:6]:
+                raise Exception("Recording made by an older version, record it again. (Path: {})".format(path))
+            raise Exception("Not a dab recording. (Path: {})".format(path))
+
+        self.beeps = [RECORDING_BEEP.unpack_from(self._map,RECORDING_HEADER.size + index * RECORDING_BEEP.size)
+                      for index in range(beep_count)]
+        self._index_offset = RECORDING_HEADER.size + beep_count * RECORDING_BEEP.size
+
+    def time(self, index):
+        '''
+        Returns the time, in seconds from the start, frame index is due.
+        '''
+        return RECORDING_FRAME.unpack_from(self._map,self._index_offset + index * RECORDING_FRAME.size)[0]
+
+    def frame(self, index):
+        '''
+        Returns the bytes of frame index as a memoryview.
+        '''
+        _, offset, length = RECORDING_FRAME.unpack_from(self._map,self._index_offset + index * RECORDING_FRAME.size)
+        return self._view[offset:offset + length]
+
+    def close(self):
+        self._view.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+################################## FUNCTIONS ###################################
+
+def record_session(session, path, diff = True):
+    '''
+    Parameters   :
+
+        session : Session to record.
+
+        path    : File to write the recording to.
+
+        diff    : Passed on to FrameRenderer. With diff on, each frame is
+                  stored as only the changes from the one before.
+
+    Return Value : Number of frames recorded.
+
+    Description  :
+
+        Renders every frame of the session as fast as possible, with
+        session time advancing one frame period per frame as in
+        render_headless, and writes exactly what the renderer would send
+        to the terminal, plus the session's beeps, to an indexed file that
+        Recording and replay play back without rendering anything.
+
+    '''
+
+    #=== Initialize =========================================#
+    output = []
+    renderer = FrameRenderer(output.append,diff = diff,binary = True)
+    frames = [] # (time, encoded frame)
+
+    cur_time = 0
+    frame_num = 0
+
+    #=== Render Frames ======================================#
+    while cur_time < session.end_time:
+        animated_frame, framerate = session.render(cur_time,frame_num)
+        renderer.render(animated_frame)
+        frames.append((cur_time,b"".join(output)))
+        output.clear()
+
+        cur_time = session.timeline.frame_after(cur_time,framerate)
+        frame_num += 1
+
+    # Leave the cursor where a live session would
+    renderer.park()
+    frames.append((session.end_time,b"".join(output)))
+
+    #=== Write File =========================================#
+    beeps = session.beeps()
+    data_offset = RECORDING_HEADER.size + len(beeps) * RECORDING_BEEP.size + len(frames) * RECORDING_FRAME.size
+
+    with open(path,"wb") as recording_file:
+        recording_file.write(RECORDING_HEADER.pack(RECORDING_MAGIC,len(frames),len(beeps),session.end_time))
+        for beep in beeps:
+            recording_file.write(RECORDING_BEEP.pack(*beep))
+
+        for frame_time, data in frames:
+            recording_file.write(RECORDING_FRAME.pack(frame_time,data_offset,len(data)))
+            data_offset += len(data)
+
+        for _, data in frames:
+            recording_file.write(data)
+
+    return len(frames)
+
+async def replay(recording, write, audio = True, flush = None):
+    '''
+    Parameters   :
+
+        recording : Recording to play.
+
+        write     : Callable taking bytes, e.g. sys.stdout.buffer.write.
+
+        audio     : If True, play the recorded beeps.
+
+        flush     : Optional callable, called after each frame is written.
+
+    Description  :
+
+        Coroutine writing each recorded frame at its time from the start,
+        with the beeps on the same clock. Frames hold only what changed,
+        so a late frame is written late rather than skipped.
+
+    '''
+
+    #=== Initialize =========================================#
+    loop = asyncio.get_running_loop()
+    origin = loop.time()
+    elapsed = lambda: loop.time() - origin
+
+    beep_task = asyncio.create_task(play_beeps(beep_schedule(recording.beeps),elapsed)) if audio else None
+
+    #=== Play Frames ========================================#
+    try:
+        for index in range(recording.frame_count):
+            await asyncio.sleep(max(0,recording.time(index) - elapsed()))
+            write(recording.frame(index))
+            if flush is not None:
+                flush()
+
+    finally:
+        if beep_task is not None:
+            beep_task.cancel()
+            await asyncio.gather(beep_task,return_exceptions = True)
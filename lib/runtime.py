@@ -0,0 +1,213 @@
+################################### IMPORTS ####################################
+
+import asyncio
+from signal import SIGINT
+
+from lib.scheduler import FrameScheduler
+from lib.profiler import NullProfiler
+from lib.governor import NullGovernor
+from lib.sound_lib import prepare_beeps,play_beep
+from lib.timeline import PHASE_EVENT
+
+################################## CONSTANTS ###################################
+
+################################### GLOBALS ####################################
+
+NULL_PROFILER = NullProfiler()
+NULL_GOVERNOR = NullGovernor()
+
+################################### CLASSES ####################################
+
+class SessionRuntime:
+    '''
+    Parameters   :
+
+        session        : Session to run.
+
+        renderer       : FrameRenderer the frames are drawn with.
+
+        profiler       : FrameProfiler to record frame and beep timings on.
+
+        audio          : If True, play the session's beeps.
+
+        flush          : Optional coroutine function awaited after each frame
+                         is drawn, e.g. a StreamWriter's drain.
+
+        handle_signals : If True, SIGINT cancels the session.
+
+        on_first_frame : Optional callable, called once the first frame has
+                         been drawn.
+
+        governor       : QualityGovernor that lowers the frame rate and
+                         animation quality when frames fall behind.
+                         (Default: always full quality)
+
+        play           : Optional callable playing one beep tuple in place of
+                         the audio device, see play_beeps.
+
+    Description  :
+
+        Runs a session as coroutines on one asyncio event loop: one draws
+        frames, one plays beeps. Both measure their deadlines from the same
+        origin on the loop clock, so a beep due at a phase change is played
+        on the same tick the new phase is first drawn. Stopping is done by
+        cancelling, which unwinds both coroutines through their cleanup.
+
+        All timing goes through the running loop's clock, so on a
+        SimEventLoop a whole session runs on virtual time.
+
+    '''
+
+    def __init__(self, session, renderer, profiler = NULL_PROFILER, audio = True,
+                 flush = None, handle_signals = False, on_first_frame = None, governor = NULL_GOVERNOR,
+                 play = None):
+        self.session        = session
+        self.renderer       = renderer
+        self.profiler       = profiler
+        self.audio          = audio
+        self.flush          = flush
+        self.handle_signals = handle_signals
+        self.on_first_frame = on_first_frame
+        self.governor       = governor
+        self.play           = play
+        self.scheduler      = None
+        self.stopped        = False
+
+        self._frame_task = None
+
+    async def run(self):
+        '''
+        Runs the session to its end, or until cancelled. Returns True if the
+        session ran to its end.
+        '''
+
+        #=== Initialize =========================================#
+        loop = asyncio.get_running_loop()
+        self.scheduler = FrameScheduler(clock = loop.time).start()
+
+        frame_task = self._frame_task = asyncio.create_task(self.draw_frames())
+        beep_task = asyncio.create_task(self.play_beeps()) if self.audio else None
+
+        if self.handle_signals:
+            loop.add_signal_handler(SIGINT,self.stop)
+
+        #=== Run ================================================#
+        try:
+            await frame_task
+            return True
+        except asyncio.CancelledError:
+            if not self.stopped:
+                raise
+            return False
+        finally:
+            if self.handle_signals:
+                loop.remove_signal_handler(SIGINT)
+            frame_task.cancel()
+            if beep_task is not None:
+                beep_task.cancel()
+                await asyncio.gather(beep_task,return_exceptions = True)
+
+    def stop(self):
+        '''
+        Ends the session early. run() then returns False.
+        '''
+        self.stopped = True
+        if self._frame_task is not None:
+            self._frame_task.cancel()
+
+    async def draw_frames(self):
+        '''
+        Draws every frame of the session on the scheduler's deadlines.
+        '''
+
+        #=== Initialize =========================================#
+        session, renderer, profiler, scheduler, governor = self.session, self.renderer, self.profiler, self.scheduler, self.governor
+        quality = governor.quality
+        cur_time = 0
+        frame_num = 0
+
+        #=== Draw Frames ========================================#
+        while cur_time < session.end_time:
+            profiler.start_frame(scheduler.deadline,cur_time)
+            governor.start_frame()
+
+            animated_frame, framerate = session.render(cur_time,frame_num,profiler,quality)
+            renderer.render(animated_frame)
+            if self.flush is not None:
+                await self.flush()
+            profiler.mark("write")
+
+            if self.on_first_frame is not None and frame_num == 0:
+                self.on_first_frame()
+
+            #--- Wait for the next deadline ---------------------#
+            # At a lower frame rate each frame covers several animation frames
+            period_multiplier = quality[0]
+            quality = governor.end_frame(framerate)
+            deadline_frame = scheduler.frame
+            delay = scheduler.advance(framerate * period_multiplier)
+
+            # A phase starting before that deadline is drawn on its start
+            phase_change = session.timeline.next_event(cur_time,PHASE_EVENT)
+            if phase_change is not None and phase_change[0] < scheduler.deadline:
+                delay = scheduler.reschedule(phase_change[0])
+            else:
+                phase_change = None
+
+            await asyncio.sleep(delay)
+            frame_num += (scheduler.frame - deadline_frame) * period_multiplier
+            cur_time = scheduler.elapsed()
+            if phase_change is not None:
+                cur_time = max(cur_time,phase_change[0]) # the loop can wake a hair early
+            profiler.mark("sleep")
+            profiler.end_frame(renderer.frame_bytes)
+
+    async def play_beeps(self):
+        '''
+        Plays the session's beeps, each at its offset from the shared origin.
+        '''
+        await play_beeps(self.session.timeline.beeps(),self.scheduler.elapsed,self.profiler.record_beep,self.play)
+
+################################## FUNCTIONS ###################################
+
+async def play_beeps(schedule, elapsed, on_beep = None, play = None):
+    '''
+    Parameters   :
+
+        schedule : List of (offset, beep) tuples, as from Timeline.beeps.
+
+        elapsed  : Callable returning seconds since the origin the beep
+                   offsets are measured from.
+
+        on_beep  : Optional callable, called after each beep with its
+                   scheduled and actual offsets.
+
+        play     : Optional callable playing one beep tuple. Replaces the
+                   audio device entirely, so nothing is loaded or prepared.
+
+    Description  :
+
+        Coroutine playing each beep at its absolute offset, so a beep is
+        never late because of the ones before it. The audio libraries are
+        loaded, and every waveform prepared, in a worker thread once the
+        loop is running, so they do not hold up the first frame. Without an
+        audio device it returns straight away.
+
+    '''
+
+    #=== Initialize =========================================#
+    loop = asyncio.get_running_loop()
+    await asyncio.sleep(0) # let the first frame be drawn
+    if play is None:
+        try:
+            await loop.run_in_executor(None,prepare_beeps,[beep for _, beep in schedule])
+        except Exception:
+            return # no audio device, run silently
+        play = play_beep
+
+    #=== Play Beeps =========================================#
+    for offset, beep in schedule:
+        await asyncio.sleep(max(0,offset - elapsed()))
+        play(*beep)
+        if on_beep is not None:
+            on_beep(offset,elapsed())
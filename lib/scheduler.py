@@ -0,0 +1,195 @@
+################################### IMPORTS ####################################
+
+import asyncio,selectors,time
+
+################################## CONSTANTS ###################################
+
+################################### GLOBALS ####################################
+
+################################### CLASSES ####################################
+
+class FrameScheduler:
+    '''
+    Parameters   :
+
+        clock : Callable returning monotonic seconds. (Default: time.perf_counter)
+
+        sleep : Callable sleeping for a number of seconds. (Default: time.sleep)
+
+    Description  :
+
+        Paces a render loop against deadlines measured from a single origin
+        on a monotonic clock, rather than adding up the length of each
+        frame. A slow frame does not push back the ones after it: any
+        deadline that has already passed is skipped (and counted in
+        dropped) so the loop catches up instead of drifting.
+
+        frame is the index of the current frame's deadline, which keeps
+        advancing across dropped frames so animations stay in real time.
+
+    '''
+
+    def __init__(self, clock = time.perf_counter, sleep = time.sleep):
+        self.clock    = clock
+        self.sleep    = sleep
+        self.origin   = None
+        self.deadline = 0 # current frame's deadline, in seconds since origin
+        self.frame    = 0
+        self.rendered = 0
+        self.dropped  = 0
+
+    def start(self):
+        '''
+        Sets the origin to now. The first frame is due immediately.
+        '''
+        self.origin   = self.clock()
+        self.deadline = 0
+        self.frame    = 0
+        self.rendered = 0
+        self.dropped  = 0
+        return self
+
+    def elapsed(self):
+        '''
+        Returns seconds since start().
+        '''
+        return self.clock() - self.origin
+
+    def advance(self, period):
+        '''
+        Parameters   :
+
+            period : Seconds between this frame's deadline and the next.
+
+        Return Value : Seconds left until the next deadline.
+
+        Description  :
+
+            Marks the current frame as rendered and moves on to the next
+            deadline. If that deadline has already passed, it and any other
+            missed ones are dropped and the next deadline still ahead is
+            used instead. Used directly by callers that do their own
+            sleeping, such as coroutines.
+
+        '''
+
+        #=== Initialize =========================================#
+        self.rendered += 1
+        self.deadline += period
+        self.frame += 1
+
+        #--- Drop missed deadlines --------------------------#
+        now = self.elapsed()
+        if now > self.deadline:
+            missed = int((now - self.deadline) // period) + 1
+            self.deadline += missed * period
+            self.frame += missed
+            self.dropped += missed
+
+        return max(0, self.deadline - now)
+
+    def reschedule(self, deadline):
+        '''
+        Moves the next deadline to deadline (in seconds since the origin),
+        e.g. onto an event falling between two frames. The deadlines after
+        it follow on from there. Returns seconds left until it.
+        '''
+        self.deadline = deadline
+        return max(0, self.deadline - self.elapsed())
+
+    def wait(self, period):
+        '''
+        Advances to the next deadline (see advance) and sleeps until it is
+        due. Returns the index of the frame that is now due.
+        '''
+        self.advance(period)
+        self.sleep(max(0, self.deadline - self.elapsed()))
+        return self.frame
+
+    def fps(self):
+        '''
+        Returns the number of frames actually rendered per second so far.
+        '''
+        elapsed = self.elapsed()
+        return self.rendered / elapsed if elapsed > 0 else 0
+
+class SimClock:
+    '''
+    Parameters   :
+
+        start : Time, in seconds, the clock starts at.
+
+    Description  :
+
+        Virtual clock that only moves when something sleeps on it: sleep
+        moves the time forward and returns straight away. time and sleep
+        stand in for the clock / sleep pairs FrameScheduler and
+        sound_thread take, and SimEventLoop runs asyncio code on it, so a
+        whole session plays out in the time it takes to render its frames.
+
+    '''
+
+    def __init__(self, start = 0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+
+class SimSelector(selectors.DefaultSelector):
+    '''
+    Selector that, instead of blocking until the next timer is due, sleeps
+    on a SimClock. It only really blocks when there is no timer to jump to,
+    e.g. while waiting on a worker thread.
+    '''
+
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout = None):
+        if timeout is None:
+            return super().select(None)
+        events = super().select(0)
+        if not events:
+            self.clock.sleep(timeout)
+        return events
+
+class SimEventLoop(asyncio.SelectorEventLoop):
+    '''
+    Parameters   :
+
+        clock : SimClock to run on. (Default: a new one starting at 0)
+
+    Description  :
+
+        Event loop whose time is clock's. Whenever nothing is ready to run
+        the clock jumps to the next timer, so asyncio.sleep and loop.time
+        (and with them SessionRuntime and play_beeps) run on virtual time.
+
+    '''
+
+    def __init__(self, clock = None):
+        self.clock = clock or SimClock()
+        super().__init__(SimSelector(self.clock))
+
+    def time(self):
+        return self.clock.now
+
+################################## FUNCTIONS ###################################
+
+def run_simulated(main, clock = None):
+    '''
+    Runs the coroutine main to completion on a SimEventLoop, like
+    asyncio.run, and returns its result.
+    '''
+    loop = SimEventLoop(clock)
+    try:
+        return loop.run_until_complete(main)
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.run_until_complete(loop.shutdown_default_executor())
+        loop.close()
@@ -0,0 +1,399 @@
+################################### IMPORTS ####################################
+
+import io,time,random
+
+from lib.termio import *
+from lib.profiler import NullProfiler
+from lib.governor import FULL_QUALITY
+from lib.timeline import Timeline
+
+################################## CONSTANTS ###################################
+
+#Art stuff
+HEAT_FRAMERATE = 1/30
+COOL_FRAMERATE = 1/30
+DAB_FRAMERATE  = 1/30
+
+HEAT_ANIMATION_SPEED = 1
+COOL_ANIMATION_SPEED = 0.5
+DAB_ANIMATION_SPEED  = 3
+
+HEAT_ANIMATION = "pulse"
+COOL_ANIMATION = "pulse"
+DAB_ANIMATION  = "vert"
+
+SECTION_PADDING = 2
+
+HEAT_MESSAGE = "HEAT"
+COOL_MESSAGE = "COOL"
+DAB_MESSAGE  = "DAB!"
+
+PROGRESS_BAR_WIDTH = 21
+
+BANNER_WIDTH = 23
+
+ROUNDING_PLACE = 2
+
+DAB_WORD_MAX_COLS = 4
+DAB_WORD_MAX_ROWS = 5
+DAB_MAX_WORDS = DAB_WORD_MAX_COLS * DAB_WORD_MAX_ROWS
+
+PHASES = ["HEAT","COOL","DAB"]
+
+# Animation drawn in place of the phase's own at reduced quality
+CHEAP_ANIMATION = pulse
+
+# Banner text of the HEAT and COOL phases, each {name} line is a template slot
+BANNER_LAYOUT = "\n{label}\n\n{bar}\n\n{countdown}"
+
+# Animation function, color sequence, inverted, animation speed and frame period of each phase
+PHASE_ANIMATIONS = {"HEAT":(pulse,       COLORS_RED,        False,HEAT_ANIMATION_SPEED,HEAT_FRAMERATE),
+                    "COOL":(horiz_lines, COLORS_BLUE,       True, COOL_ANIMATION_SPEED,COOL_FRAMERATE),
+                    "DAB" :(vert_lines,  COLORS_RAINBOW_16, True, DAB_ANIMATION_SPEED, DAB_FRAMERATE)}
+
+#ASCII art
+ASCII_POT_LEAF ="""        /\\
+ |\\    /  \\    /|
+ | \\   \\  /   / |
+ |  |  \\  /  |  |
+  \\  \\ \\  / /  /
+|\\__\\ \\\\  // /__/|
+ \\___--    --___/
+     /_/||\\_\\
+        ||"""
+
+
+ASCII_ART = [ASCII_POT_LEAF]
+
+################################### GLOBALS ####################################
+
+NULL_PROFILER = NullProfiler()
+
+################################### CLASSES ####################################
+
+class Session:
+    '''
+    Parameters   :
+
+        heat_time : Seconds of heating.
+
+        cool_time : Seconds of cooling.
+
+        timeout   : Seconds the DAB screen stays up after cooling.
+
+        art       : ASCII art drawn either side of the banner.
+                    (Default: a random choice from ASCII_ART)
+
+        animation_cache : AnimationCache the DAB frames are colored through,
+                          which can be shared between sessions.
+                          (Default: a new one)
+
+    Description  :
+
+        Everything needed to draw one heat/cool/dab session. render returns
+        the colored frame for any point in the session, independent of how
+        (or whether) it is then shown or timed.
+
+        Frames are drawn on a Canvas that lives as long as the session: the
+        art is drawn on it once, and each frame only fills in the slots of
+        the banner template (label, progress bar and countdown), recolors
+        the cells and encodes the result.
+
+        The phases and beeps are compiled into one Timeline, which both the
+        frames (through phase) and the beeps are timed from.
+
+    '''
+
+    def __init__(self, heat_time, cool_time, timeout, art = None, animation_cache = None):
+        self.heat_time  = heat_time
+        self.cool_time  = cool_time
+        self.timeout    = timeout
+        self.total_time = heat_time + cool_time
+        self.timeline   = self.build_timeline()
+        self.end_time   = self.timeline.end_time
+
+        self.art        = art if art is not None else random.choice(ASCII_ART)
+        self.layout_key = self.art # frames are cached per layout
+
+        self.build_layout()
+
+        self.animation_cache = animation_cache if animation_cache is not None else AnimationCache()
+
+    def __reduce__(self):
+        # Pickled (e.g. for worker processes) as the arguments to build it again
+        return (Session,(self.heat_time,self.cool_time,self.timeout,self.art))
+
+    def build_layout(self):
+        '''
+        Creates the canvas, with the static art drawn on it once, and the
+        banner template.
+        '''
+        self.art_height = len(self.art.split("\n"))
+        self.art_width  = max(map(len,self.art.split("\n")))
+
+        self.banner_col = self.art_width + SECTION_PADDING
+        self.canvas = Canvas(self.banner_col + BANNER_WIDTH + SECTION_PADDING + self.art_width,self.art_height)
+        self.canvas.blit(0,0,self.art)
+        self.canvas.blit(0,self.banner_col + BANNER_WIDTH + SECTION_PADDING,self.art)
+        self.bar      = get_progress_bar(PROGRESS_BAR_WIDTH)
+        self.template = BannerTemplate(self.canvas,0,self.banner_col,BANNER_WIDTH,self.art_height,BANNER_LAYOUT)
+
+    def build_timeline(self):
+        '''
+        Returns the Timeline of the session's phases and beeps.
+        '''
+        return Timeline([("HEAT",self.heat_time),("COOL",self.cool_time),("DAB",self.timeout)],
+                        [(0,350,0.05,7,60),
+                         (self.heat_time,550,0.06,6,-75),
+                         (self.total_time,550,0.05,5,60),
+                         (self.total_time + 1,550,0.05,5,60),
+                         (self.total_time + 2,550,0.05,5,60)])
+
+    def beeps(self):
+        '''
+        Returns the beep sequence for sound_thread.
+        '''
+        return self.timeline.beep_list()
+
+    def phase(self, cur_time):
+        '''
+        Returns the name of the phase ("HEAT", "COOL" or "DAB") at cur_time.
+        '''
+        return self.timeline.phase(cur_time)
+
+    def frame_slots(self, cur_time):
+        '''
+        Returns the text of each banner slot at cur_time, in the order of
+        BANNER_LAYOUT, or None during the DAB phase which has no slots.
+        '''
+        phase = self.phase(cur_time)
+        if phase == "HEAT":
+            return (HEAT_MESSAGE,
+                    self.bar.render(min(cur_time/self.heat_time,1)),
+                    "{:<6}".format(str(round(cur_time,ROUNDING_PLACE))))
+
+        elif phase == "COOL":
+            return (COOL_MESSAGE,
+                    self.bar.render(min(max(cur_time-self.heat_time,0)/self.cool_time,1),inverted = True),
+                    "{:<6}".format(str(round(self.total_time - cur_time,ROUNDING_PLACE))))
+
+        return None
+
+    def frame_text(self, cur_time):
+        '''
+        Returns the text written inside the banner at cur_time.
+        '''
+        slots = self.frame_slots(cur_time)
+        if slots is not None:
+            return BANNER_LAYOUT.format(**dict(zip(self.template.slot_names,slots)))
+
+        frame_text = "\n"
+        timeout_elapsed = cur_time - self.total_time
+        timeout_percent = min(timeout_elapsed / 3,1)
+        num_dab_words = max(1,int(timeout_percent * DAB_MAX_WORDS))
+
+        while(num_dab_words > 0):
+            for _ in range(min(num_dab_words, DAB_WORD_MAX_COLS)):
+                frame_text += "DAB! "
+                num_dab_words -= 1
+
+            frame_text += "\n"
+
+        return frame_text
+
+    def render(self, cur_time, frame_num, profiler = NULL_PROFILER, quality = FULL_QUALITY):
+        '''
+        Parameters   :
+
+            cur_time  : Seconds since the start of the session.
+
+            frame_num : Animation frame number.
+
+            profiler  : FrameProfiler to mark the text, layout and color
+                        stages on.
+
+            quality   : Quality tuple from QualityGovernor. The cheap
+                        animation and color flags are applied here, the
+                        period multiplier is left to the caller.
+
+        Return Value : Tuple of (frame, seconds until the next frame). The
+                       frame is the session's Canvas, or a CanvasFrame for
+                       cached frames, for FrameRenderer to draw. It only
+                       holds until the next call. str(frame) is its text.
+
+        '''
+
+        #=== Create Text ========================================#
+        content = self.frame_slots(cur_time)
+        if content is None:
+            content = self.frame_text(cur_time)
+        profiler.mark("text")
+
+        #=== Draw Frame =========================================#
+        _, cheap, color = quality
+        animation, color_sequence, inverted, speed, framerate = PHASE_ANIMATIONS[self.phase(cur_time)]
+        if not color:
+            animation = None
+        elif cheap:
+            animation = CHEAP_ANIMATION
+
+        phase = int(frame_num * speed) % animation_period(animation,color_sequence) if animation else 0
+
+        args = (content,animation,phase,color_sequence,inverted,profiler)
+        if isinstance(content,tuple):
+            # HEAT and COOL frames carry a 10 ms countdown, so they never repeat
+            animated_frame = self.draw(*args)
+        else:
+            animated_frame = self.animation_cache.cached((self.layout_key,content,animation,phase),self.draw_snapshot,*args)
+        profiler.mark("color")
+
+        return animated_frame, framerate
+
+    def draw(self, content, animation, frame_num, color_sequence, inverted = False, profiler = NULL_PROFILER):
+        '''
+        Draws content on the canvas (see draw_layout), colors it with the
+        canvas version of animation (or no color at all if animation is
+        None) and returns the canvas.
+        '''
+        self.draw_layout(content)
+        profiler.mark("layout")
+
+        if animation is None:
+            self.canvas.palette = None
+        else:
+            CANVAS_ANIMATIONS[animation](self.canvas,frame_num,color_sequence,inverted)
+            self.canvas.palette = color_sequence
+        return self.canvas
+
+    def draw_snapshot(self, *args):
+        '''
+        Returns draw(*args) as a CanvasFrame, which can be kept.
+        '''
+        return self.draw(*args).snapshot()
+
+    def draw_layout(self, content):
+        '''
+        Draws the banner on the canvas. content is either the slot text from
+        frame_slots or, for the DAB phase, the full banner text.
+        '''
+        if isinstance(content,tuple):
+            self.template.fill(content)
+        else:
+            draw_banner(self.canvas,0,self.banner_col,content,BANNER_WIDTH,self.art_height)
+            self.template.reset()
+
+class LargeSession(Session):
+    '''
+    Parameters   :
+
+        heat_time, cool_time, timeout, animation_cache : As for Session.
+
+        cols, rows : Size of the screen to fill.
+
+        fonts      : Figlet fonts to choose from, largest first.
+
+    Description  :
+
+        Session for wall displays. Instead of the art and banner, the phase
+        label and countdown are drawn as figlet text in the largest font
+        that fits the screen, with a progress bar across it. The text is
+        put together from a GlyphCache, so pyfiglet only runs once per
+        glyph.
+
+    '''
+
+    def __init__(self, heat_time, cool_time, timeout, cols, rows, animation_cache = None, fonts = LARGE_FONTS):
+        self.cols  = cols
+        self.rows  = rows
+        self.fonts = fonts
+        Session.__init__(self,heat_time,cool_time,timeout,art = "",animation_cache = animation_cache)
+
+    def __reduce__(self):
+        return (LargeSession,(self.heat_time,self.cool_time,self.timeout,self.cols,self.rows,None,self.fonts))
+
+    def build_layout(self):
+        '''
+        Creates the canvas and picks the font.
+        '''
+        self.canvas = Canvas(self.cols,self.rows)
+        self.bar    = get_progress_bar(max(2,self.cols - 2 * SECTION_PADDING))
+
+        # Label and countdown share the rows left by the bar and the gaps around it
+        widest_countdown = "8" * len(str(int(max(self.heat_time,self.cool_time)))) + ".88"
+        self.glyphs = fit_font([HEAT_MESSAGE,COOL_MESSAGE,DAB_MESSAGE,widest_countdown],
+                               self.cols,(self.rows - 3) // 2,self.fonts)
+        self.layout_key = ("large",self.cols,self.rows,self.glyphs.font)
+
+    def draw_layout(self, content):
+        '''
+        Draws the label, bar and countdown (or DAB_MESSAGE during the DAB
+        phase) centered on the canvas.
+        '''
+        if isinstance(content,tuple):
+            label, bar, countdown = content
+            lines = self.glyphs.render(label) + ["",bar,""] + self.glyphs.render(countdown.strip())
+        else:
+            lines = self.glyphs.render(DAB_MESSAGE)
+
+        top = (self.rows - len(lines)) // 2
+        for row in range(self.rows):
+            line = lines[row - top] if 0 <= row - top < len(lines) else ""
+            self.canvas.write(row,0,line.center(self.cols))
+
+################################## FUNCTIONS ###################################
+
+def render_headless(session, max_frames = None, diff = True):
+    '''
+    Parameters   :
+
+        session    : Session to render.
+
+        max_frames : Stop after this many frames. (Default: the whole session)
+
+        diff       : Passed on to FrameRenderer.
+
+    Return Value : Dictionary mapping each phase name to a dictionary with its
+                   frames, seconds, fps and bytes_per_frame.
+
+    Description  :
+
+        Runs the full frame pipeline, renderer included, against an in-memory
+        buffer with no sleeping. Session time advances by exactly one frame
+        period per frame (up to the start of the next phase, see
+        Timeline.frame_after), so the frames are the ones a real session
+        would draw, but they are produced as fast as the renderer allows.
+
+    '''
+
+    #=== Initialize =========================================#
+    buffer = io.StringIO()
+    renderer = FrameRenderer(buffer.write,diff = diff)
+    stats = {phase:{"frames":0,"seconds":0,"bytes":0} for phase in PHASES}
+
+    cur_time = 0
+    frame_num = 0
+
+    #=== Render Frames ======================================#
+    while cur_time < session.end_time and (max_frames is None or frame_num < max_frames):
+        start_time = time.perf_counter()
+
+        animated_frame, framerate = session.render(cur_time,frame_num)
+        renderer.render(animated_frame)
+        buffer.seek(0)
+        buffer.truncate()
+
+        phase_stats = stats[session.phase(cur_time)]
+        phase_stats["seconds"] += time.perf_counter() - start_time
+        phase_stats["frames"] += 1
+        phase_stats["bytes"] += renderer.frame_bytes
+
+        cur_time = session.timeline.frame_after(cur_time,framerate)
+        frame_num += 1
+
+    #=== Summarize ==========================================#
+    for phase_stats in stats.values():
+        frames = phase_stats["frames"]
+        phase_stats["fps"] = frames / phase_stats["seconds"] if phase_stats["seconds"] else 0
+        phase_stats["bytes_per_frame"] = phase_stats.pop("bytes") / frames if frames else 0
+
+    return stats
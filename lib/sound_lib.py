@@ -1,55 +1,419 @@
 ################################### IMPORTS ####################################
 
-import time
-import numpy as np
-import sounddevice as sd
+import time,os,hashlib
+from collections import deque
+
+# numpy and sounddevice (which initializes PortAudio) are slow to import, so
+# they are only imported by the functions that need them. prepare_beeps
+# loads them in an executor thread, started by play_beeps in lib.runtime
+# once the event loop is running, so the first frame is not held up by them.
 
 ################################## CONSTANTS ###################################
 
+# Used when the output device does not report its own
+SAMPLE_RATE = 48000
+SAMPLE_DTYPE = "float32"
+
+# Sample formats tried on the output device, most preferred first
+PREFERRED_DTYPES = ["float32","int16"]
+
+WAVEFORM_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),"dab","waveforms")
+WAVEFORM_CACHE_MAX_BYTES = 32 * 1024 * 1024
+WAVEFORM_CACHE_VERSION = 2 # bump when synthesize_beep's output changes
+
 ################################### GLOBALS ####################################
 
+_engine = None
+_waveforms = None
+_audio_format = (None,None) # (sample_rate, dtype) set by configure_audio
+
+################################### CLASSES ####################################
+
+class AudioEngine:
+    '''
+    Parameters   :
+
+        sample_rate    : Samples per second of the output stream.
+
+        dtype          : Numpy dtype of the output stream.
+
+        stream_factory : Callable with the signature of sd.OutputStream, used to
+                         open the stream. (Default: sd.OutputStream)
+
+        blocksize      : Frames per callback, 0 lets PortAudio choose.
+
+    Description  :
+
+        Keeps one output stream open for the life of the process and mixes
+        every queued waveform into it from the stream callback. Playing a
+        sound is only an append to a queue, so there is no device open or
+        close per beep and overlapping sounds do not block each other.
+
+    '''
+
+    def __init__(self, sample_rate = SAMPLE_RATE, dtype = SAMPLE_DTYPE, stream_factory = None, blocksize = 0):
+        self.sample_rate    = sample_rate
+        self.dtype          = dtype
+        self.stream_factory = stream_factory
+        self.blocksize      = blocksize
+        self.stream         = None
+
+        self._pending = deque() # waveforms queued by play(), drained by the callback
+        self._voices  = []      # [waveform, position] pairs currently mixing
+        self._mix     = None    # wider buffer integer formats are mixed in
+
+    def start(self):
+        '''
+        Opens and starts the output stream if it is not already running.
+        '''
+        if self.stream is None:
+            factory = self.stream_factory
+            if factory is None:
+                import sounddevice as sd
+                factory = sd.OutputStream
+            self.stream = factory(samplerate = self.sample_rate, channels = 1, dtype = self.dtype,
+                                  blocksize = self.blocksize, callback = self._callback)
+            self.stream.start()
+        return self
+
+    def close(self):
+        '''
+        Stops and closes the output stream, dropping anything still playing.
+        '''
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+        self._pending.clear()
+        self._voices = []
+
+    def play(self, waveform):
+        '''
+        Queues a 1-D waveform to be mixed in from the next callback on.
+        '''
+        self._pending.append(waveform)
+
+    def is_active(self):
+        '''
+        Returns True while any queued waveform has samples left to play.
+        '''
+        return bool(self._pending or self._voices)
+
+    def _callback(self, outdata, frames, time_info, status):
+        '''
+        Stream callback. Mixes every active voice into outdata.
+        '''
+        import numpy as np # already loaded for the waveforms, this is only a lookup
+
+        #=== Initialize =========================================#
+        outdata.fill(0)
+        out = outdata[:,0]
+
+        while self._pending:
+            self._voices.append([self._pending.popleft(), 0])
+
+        # Integer samples would wrap around when voices overlap, so they
+        # are summed in an int32 buffer and clipped back
+        integer = out.dtype.kind == "i"
+        if integer and len(self._voices) > 1:
+            if self._mix is None or len(self._mix) < frames:
+                self._mix = np.zeros(frames, dtype = np.int32)
+            mix = self._mix[:frames]
+            mix.fill(0)
+        else:
+            mix = out
+
+        #=== Mix Voices =========================================#
+        remaining = []
+        for voice in self._voices:
+            waveform, position = voice
+            chunk = waveform[position:position + frames]
+            mix[:len(chunk)] += chunk
+
+            voice[1] += len(chunk)
+            if voice[1] < len(waveform):
+                remaining.append(voice)
+
+        if len(self._voices) > 1:
+            if integer:
+                limits = np.iinfo(out.dtype)
+                mix.clip(limits.min, limits.max, out = mix)
+                out[:] = mix
+            else:
+                out.clip(-1, 1, out = out)
+
+        self._voices = remaining
+
+class WaveformCache:
+    '''
+    Parameters   :
+
+        directory : Directory the waveforms are stored in, created on first
+                    write. None keeps them in memory only.
+                    (Default: WAVEFORM_CACHE_DIR)
+
+        max_bytes : Size the directory is trimmed back to, dropping the
+                    least recently used files first.
+
+    Description  :
+
+        Beep waveforms are fully determined by their parameters, so each
+        one is synthesized once and saved as a .npy file named after a hash
+        of those parameters. Later runs load it with np.load(mmap_mode='r')
+        instead of synthesizing it again, and within a run it is kept in
+        memory, so playing a beep that has been prepared is only a
+        dictionary lookup.
+
+        Any error reading or writing the directory (read-only home, full
+        disk, corrupt file) falls back to synthesizing in memory. A file
+        that cannot be loaded is deleted, and written again if it can be.
+
+    '''
+
+    def __init__(self, directory = WAVEFORM_CACHE_DIR, max_bytes = WAVEFORM_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.waveforms = {} # key -> waveform already loaded this run
+        self.hits      = 0  # loaded from disk
+        self.misses    = 0  # synthesized
+
+    def waveform(self, freq_hz, duration_s, count, step = 0, attenuation = 0.3,
+                 sample_rate = SAMPLE_RATE, dtype = SAMPLE_DTYPE):
+        '''
+        Returns the waveform synthesize_beep would return for these
+        parameters, loading or synthesizing it if this run has not yet.
+        '''
+        params = (float(freq_hz),float(duration_s),int(count),float(step),float(attenuation),int(sample_rate),str(dtype))
+        waveform = self.waveforms.get(params)
+        if waveform is None:
+            waveform = self.waveforms[params] = self._load(params)
+        return waveform
+
+    def prepare(self, beep_list, sample_rate = SAMPLE_RATE, dtype = SAMPLE_DTYPE):
+        '''
+        Loads the waveform of every beep of a sound_thread style beep list,
+        in the given sample rate and dtype.
+        '''
+        for beep in beep_list:
+            self.waveform(*beep[1:],sample_rate = sample_rate,dtype = dtype)
+
+    def path(self, params):
+        '''
+        Returns the file the waveform with the given parameters is kept in.
+        '''
+        key = hashlib.sha1(repr((WAVEFORM_CACHE_VERSION,) + params).encode()).hexdigest()
+        return os.path.join(self.directory,key + ".npy")
+
+    def _load(self, params):
+        import numpy as np
+
+        #=== Load from disk =====================================#
+        if self.directory is not None:
+            path = self.path(params)
+            try:
+                waveform = np.load(path,mmap_mode = "r")
+                os.utime(path) # mark as recently used for eviction
+                self.hits += 1
+                return waveform
+            except FileNotFoundError:
+                pass
+            except (OSError,ValueError,EOFError): # EOFError for an empty or truncated file
+                try:
+                    os.remove(path) # synthesized again below
+                except OSError:
+                    pass
+
+        #=== Synthesize and save ================================#
+        freq_hz, duration_s, count, step, attenuation, sample_rate, dtype = params
+        waveform = synthesize_beep(freq_hz,duration_s,count,step,attenuation,sample_rate = sample_rate,dtype = dtype)
+        self.misses += 1
+
+        if self.directory is not None:
+            try:
+                os.makedirs(self.directory,exist_ok = True)
+                temp_path = "{}.{}.tmp".format(path,os.getpid())
+                with open(temp_path,"wb") as temp_file:
+                    np.save(temp_file,waveform)
+                os.replace(temp_path,path) # readers never see a partial file
+                self.evict()
+            except OSError:
+                pass
+
+        return waveform
+
+    def evict(self):
+        '''
+        Deletes the least recently used files until the directory holds at
+        most max_bytes.
+        '''
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime,stat.st_size,entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
 ################################## FUNCTIONS ###################################
 
-def sound_thread(beep_list):
+def sound_thread(beep_list,on_beep = None,clock = time.monotonic,sleep = time.sleep,play = None):
     '''
     Parameters   :
 
         beep_list : list of tuples, each tuple containing the following:
 
-            float : How long to sleep, in seconds, after the previous beep
+            float : How long to wait, in seconds, after the previous beep started
             int   : initial frequency of beep(s)
             float : duration of each beep in the given tuple
             int   : number of beeps in given tuple
             int   : number of hertz to increase between each beep in given tuple
 
+        on_beep   : Optional callable, called after each beep is queued with the
+                    scheduled and actual offsets, in seconds, from the start
+                    of the thread.
+
+        clock     : Callable returning monotonic seconds. (Default: time.monotonic)
+
+        sleep     : Callable sleeping for a number of seconds. (Default: time.sleep)
+
+        play      : Callable playing one beep tuple in place of play_beep, which
+                    also skips preparing the waveforms. With a SimClock's
+                    time and sleep this plays a whole beep list instantly.
+
     Description  :
 
         Takes a list of beep-tuples. For each tuple, the function will
         Wait for a given amount of time, then pass the tuple to the
-        play_beep function. Each tuple will play a single continuous sound
-        consisting of one or more tones without pause in between. Sounds can
-        increase linearly either negative or positive.
+        play_beep function. Deadlines are kept on the monotonic clock, so
+        the time spent queueing a beep does not push back the next one.
+        Each tuple will play a single continuous sound consisting of one
+        or more tones without pause in between. Sounds can increase
+        linearly either negative or positive.
 
     '''
 
     #=== Initialize =========================================#
-    prev_time = 0
+    if play is None:
+        prepare_beeps(beep_list)
+        play = play_beep
+    start_time = clock()
+    deadline = start_time
 
     #=== Play Beeps =========================================#
     for beep in beep_list:
 
         #--- Sleep until time -------------------------------#
-        time.sleep(max(0,beep[0]-prev_time))
+        deadline += beep[0]
+        sleep(max(0,deadline - clock()))
 
         #--- Play sound -------------------------------------#
-        start_time = time.time()
-
-        play_beep(*beep)
+        play(*beep)
 
-        prev_time = time.time() - start_time #accounts for time it takes to play sound
+        if on_beep is not None:
+            on_beep(deadline - start_time, clock() - start_time)
 
     return
 
+def get_engine():
+    '''
+    Returns the process wide AudioEngine, opening its stream on first use
+    in the format chosen by negotiate_format.
+    '''
+    global _engine
+    if _engine is None:
+        _engine = AudioEngine(*negotiate_format(*_audio_format)).start()
+    return _engine
+
+def configure_audio(sample_rate = None, dtype = None):
+    '''
+    Sets the sample rate and dtype the AudioEngine is opened with, instead
+    of asking the output device. None leaves that one up to the device.
+    Only has an effect before the first get_engine call.
+    '''
+    global _audio_format
+    _audio_format = (sample_rate,dtype)
+
+def negotiate_format(sample_rate = None, dtype = None, device = None, check = None):
+    '''
+    Parameters   :
+
+        sample_rate : Sample rate to use. (Default: the device's own)
+
+        dtype       : Sample format to use. (Default: the first of
+                      PREFERRED_DTYPES the device accepts)
+
+        device      : Device info dictionary, as sd.query_devices returns.
+                      (Default: the default output device)
+
+        check       : Callable(sample_rate, dtype) raising an Exception if the
+                      device cannot play that format.
+                      (Default: sd.check_output_settings)
+
+    Return Value : Tuple of (sample_rate, dtype).
+
+    Description  :
+
+        Picks the format beeps are synthesized and played in, so that
+        PortAudio neither resamples nor converts them. The device is only
+        queried for the values not given.
+
+    '''
+
+    #=== Initialize =========================================#
+    if sample_rate is not None and dtype is not None:
+        return sample_rate, dtype
+
+    if device is None or check is None:
+        import sounddevice as sd
+        if device is None:
+            device = sd.query_devices(kind = "output")
+        if check is None:
+            check = lambda rate, candidate: sd.check_output_settings(samplerate = rate, dtype = candidate, channels = 1)
+
+    #=== Sample Rate ========================================#
+    if sample_rate is None:
+        sample_rate = int(device.get("default_samplerate") or SAMPLE_RATE)
+
+    #=== Sample Format ======================================#
+    if dtype is None:
+        for candidate in PREFERRED_DTYPES:
+            try:
+                check(sample_rate,candidate)
+            except Exception:
+                continue
+            dtype = candidate
+            break
+        else:
+            dtype = SAMPLE_DTYPE
+
+    return sample_rate, dtype
+
+def get_waveform_cache():
+    '''
+    Returns the process wide WaveformCache.
+    '''
+    global _waveforms
+    if _waveforms is None:
+        _waveforms = WaveformCache()
+    return _waveforms
+
+def prepare_beeps(beep_list):
+    '''
+    Loads (or synthesizes) every waveform of a beep list ahead of time, in
+    the format of the shared AudioEngine (opening it if need be), so
+    playing them later does no synthesis.
+    '''
+    engine = get_engine()
+    get_waveform_cache().prepare(beep_list,engine.sample_rate,engine.dtype)
+
 def play_beep(_,freq_hz, duration_s, count,step = 0,attenuation=0.3):
 
     '''
@@ -73,35 +437,93 @@ def play_beep(_,freq_hz, duration_s, count,step = 0,attenuation=0.3):
         starting at a set frequency and increasing every beep by the given
         ammount. (Default 0)
 
+        The beep is queued on the shared AudioEngine and this returns
+        immediately with the length of the sound in seconds. The waveform
+        comes from the WaveformCache, see prepare_beeps.
+
+    '''
+
+    #=== Build waveform======================================#
+    engine = get_engine()
+    waveform_quiet = get_waveform_cache().waveform(freq_hz,duration_s,count,step,attenuation,
+                                                   sample_rate = engine.sample_rate, dtype = engine.dtype)
+
+    #=== Queue sound ========================================#
+    engine.play(waveform_quiet)
+
+    return len(waveform_quiet) / engine.sample_rate
+
+def synthesize_beep(freq_hz, duration_s, count, step = 0, attenuation = 0.3,
+                    sample_rate = SAMPLE_RATE, dtype = SAMPLE_DTYPE, phase_continuous = False):
+    '''
+    Parameters   :
+
+        freq_hz          : Frequency of the first tone in hertz.
+
+        duration_s       : Duration of each tone in seconds.
+
+        count            : Number of tones in the train.
+
+        step             : Number of hertz to increase between each tone.
+
+        attenuation      : Volume. (Between 0 and 1)
+
+        sample_rate      : Samples per second of the returned waveform.
+
+        dtype            : Numpy dtype of the returned waveform. Integer
+                           dtypes are scaled to their full range.
+
+        phase_continuous : If True, each tone starts at the phase the previous
+                           one ended on, removing the click between tones.
+
+    Return Value : 1-D numpy array holding the whole beep train.
+
+    Description  :
+
+        Builds the full train of tones in a single vectorized pass. Segment
+        boundaries match the ones play_beep has always used, the per-sample
+        phase is computed once for the whole train and the sine is taken in
+        place in a buffer that is allocated only once, so the cost no longer
+        grows quadratically with the number of tones. That buffer is
+        float64 and only the result is cast to dtype: a float32 angle
+        loses precision as the train gets longer.
+
     '''
 
     #=== Initialize =========================================#
-    start_time = time.time()
-    sample_rate = 64100
-    sample_space = np.arange(duration_s * count * sample_rate)
-    waveform = np.array([])
+    import numpy as np
+
+    edges   = (sample_rate * duration_s * np.arange(count + 1)).astype(np.int64)
+    lengths = np.diff(edges)
+    freqs   = freq_hz + step * np.arange(count, dtype = np.float64)
+
+    dtype = np.dtype(dtype)
+
+    #=== Build phase ========================================#
+    #--- Phase in (cycles * sample_rate) per sample -----#
+    phase = np.repeat(freqs, lengths)
+    np.multiply(np.arange(edges[-1]), phase, out = phase)
+
+    #--- Carry phase over segment boundaries ------------#
+    if phase_continuous and count > 1:
+        segment_phase = lengths * freqs
+        offsets = (np.cumsum(segment_phase) - segment_phase) - edges[:-1] * freqs
+        phase[edges[1]:] += np.repeat(offsets[1:], lengths[1:])
 
     #=== Build waveform======================================#
-    for i in range(count):
-        #--- Get sample segment \----------------------------#
-        start_segment = int(sample_rate*duration_s*i)
-        end_segment = int(sample_rate*duration_s*(i+1))
-        sub_sample_space = sample_space[start_segment:end_segment]
-
-        #--- Create new section -----------------------------#
-        new_segment = np.sin(2*np.pi*sub_sample_space*freq_hz/sample_rate)
-        waveform = np.append(waveform,new_segment)
-
-        #--- Increase Frequency -----------------------------#
-        freq_hz += step
-
-    #--- Set volume -----------------------------------------#
-    waveform_quiet = waveform * attenuation
-
-    #=== Sleep until time ===================================#
-    sd.play(waveform_quiet,sample_rate)
-    time.sleep(duration_s*count)
-    sd.stop()
+    waveform = phase
+    np.multiply(waveform, 2 * np.pi / sample_rate, out = waveform)
+    np.sin(waveform, out = waveform)
+    waveform *= attenuation
+
+    #--- Scale integer formats --------------------------#
+    if dtype.kind != "f":
+        limits = np.iinfo(dtype)
+        waveform *= limits.max
+        np.rint(waveform, out = waveform)
+        waveform.clip(limits.min, limits.max, out = waveform)
+
+    return waveform.astype(dtype, copy = False)
 
 '''
 Parameters   :
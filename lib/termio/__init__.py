@@ -1,11 +1,11 @@
 ################################### IMPORTS ####################################
 import sys,math,random
 
-import pyfiglet
-from termcolor import colored
-
 from lib.termio.string_manipulation import *
 from lib.termio.animation import *
+from lib.termio.screen import *
+from lib.termio.canvas import *
+from lib.termio.figlet import *
 
 ################################## CONSTANTS ###################################
 
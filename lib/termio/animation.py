@@ -1,5 +1,8 @@
 ################################### IMPORTS ####################################
 
+from collections import OrderedDict
+from functools import lru_cache
+
 from lib.termio import *
 
 ################################## CONSTANTS ###################################
@@ -18,12 +21,72 @@ COLORS_RAINBOW_16 = [u"\u001b["+str(i)+(";1" if j else "")+"m" for i in [31,33,3
 
 COLORS_TEST = [u"\u001b[38;5;"+str(i)+"m" for i in [1,2,3,4,5]]
 
+RESET_COLOR = u"\u001b[0m"
+
+ANIMATION_CACHE_SIZE = 256
+
+# SGR parameters that only switch an attribute on (bold, italic, ...)
+ADDITIVE_SGR = {"1","2","3","4","5","7","8","9"}
+
 ################################### GLOBALS ####################################
 
+################################### CLASSES ####################################
+
+class AnimationCache:
+    '''
+    Parameters   :
+
+        max_size : Maximum number of colored frames to keep. The least
+                   recently used frame is dropped once it is exceeded.
+
+    Description  :
+
+        Memoizes colored frames. An animation only depends on the frame
+        number modulo its period (see animation_period), so a frame stored
+        under its text, phase and coloring is built once and repeated
+        frames cost a dictionary lookup instead of a full re-colorization.
+        Only frames that do repeat are worth storing: one whose text changes
+        every frame (such as a countdown) would only push the others out.
+        hits and misses count lookups.
+
+    '''
+
+    def __init__(self, max_size = ANIMATION_CACHE_SIZE):
+        self.max_size = max_size
+        self.frames   = OrderedDict()
+        self.hits     = 0
+        self.misses   = 0
+
+    def cached(self, key, build, *args):
+        '''
+        Returns the frame stored under key, or stores and returns
+        build(*args) if there is none.
+        '''
+
+        #=== Look Up Frame ======================================#
+        animated_frame = self.frames.get(key)
+        if animated_frame is not None:
+            self.frames.move_to_end(key)
+            self.hits += 1
+            return animated_frame
+
+        #=== Render and Store ===================================#
+        self.misses += 1
+        animated_frame = build(*args)
+        self.frames[key] = animated_frame
+        if len(self.frames) > self.max_size:
+            self.frames.popitem(last = False)
+
+        return animated_frame
+
+    def clear(self):
+        self.frames.clear()
+        self.hits = self.misses = 0
+
 ################################## FUNCTIONS ###################################
 
 def reset_color():
-    sys.stdout.write('\u001b[0m')
+    sys.stdout.write(RESET_COLOR)
 
 def enable_cursor():
     sys.stdout.write("\u001b[?25h")
@@ -31,6 +94,15 @@ def enable_cursor():
 def disable_cursor():
     sys.stdout.write("\u001b[?25l")
 
+def animation_period(animation,color_sequence):
+    '''
+    Returns the number of frames after which the given animation function
+    repeats itself for the given color sequence.
+    '''
+    if animation is horiz_lines:
+        return max(1,len(color_sequence)*2 - 2)
+    return len(color_sequence)*2
+
 def pulse(text,frame_number,color_sequence,inverted = False):
     '''
     Parameters   :
@@ -109,19 +181,81 @@ def vert_lines(text,frame_number,color_sequence,inverted = False):
         Creates vertical lines in the gradient of the color sequence moving
         right to left as the frame number grows linearly.
 
+        A color code is only emitted when the color actually changes, and
+        color changes falling on whitespace are deferred to the next visible
+        character (any extra attributes they set, such as bold, are still
+        applied), so the output renders the same as coloring every
+        character while being a fraction of the size.
+
     '''
+
+    #=== Initialize =========================================#
+    lines = text.split("\n")
+    period = len(color_sequence)*2
+    color_table = vert_line_table(frame_number % period, inverted, len(color_sequence), max(map(len,lines)))
+    attributes = color_attributes(tuple(color_sequence))
+
     frame = []
-    for line_text in text.split("\n"):
-        animated_line = ""
-        for char_index,char in enumerate(line_text):
-            if inverted:
-                char_index *= -1
-            color_index = (frame_number+char_index) % len(color_sequence*2)
-            if(color_index >= len(color_sequence)): color_index = len(color_sequence) - (color_index - len(color_sequence)) - 1
-            animated_line += color_sequence[color_index] + char
-        frame.append(animated_line)
+    current_color = None
+    applied_attributes = set()
+
+    #=== Color Lines ========================================#
+    for line_text in lines:
+        animated_line = []
+        for char, color_index in zip(line_text, color_table):
+
+            #--- Defer color changes on whitespace --------------#
+            if char.isspace():
+                extra = attributes[color_index]
+                if extra is None:
+                    if color_index != current_color:
+                        animated_line.append(color_sequence[color_index])
+                        current_color = color_index
+                elif extra and extra not in applied_attributes:
+                    animated_line.append("\u001b[" + extra + "m")
+                    applied_attributes.add(extra)
+
+            #--- Emit color only when it changes ----------------#
+            elif color_index != current_color:
+                animated_line.append(color_sequence[color_index])
+                current_color = color_index
+                if attributes[color_index]:
+                    applied_attributes.add(attributes[color_index])
+
+            animated_line.append(char)
+        frame.append("".join(animated_line))
+
     return "\n".join(frame)
 
+@lru_cache(maxsize = None)
+def vert_line_table(phase, inverted, sequence_length, width):
+    '''
+    Returns a tuple holding, for each column of a row of the given width, the
+    color index vert_lines uses at the given phase.
+    '''
+    period = sequence_length*2
+    triangle = [index if index < sequence_length else period - index - 1 for index in range(period)]
+    direction = -1 if inverted else 1
+    return tuple(triangle[(phase + direction*char_index) % period] for char_index in range(width))
+
+@lru_cache(maxsize = None)
+def color_attributes(color_sequence):
+    '''
+    Returns, for each color code in the sequence, the SGR parameters it sets
+    besides the foreground color ("" if none). The entry is None when the
+    code resets or clears attributes, in which case vert_lines cannot defer
+    it past whitespace.
+    '''
+    attributes = []
+    for code in color_sequence:
+        params = code[2:-1].split(";")
+        if params[0] == "38":
+            params = params[3:]
+        else:
+            params = params[1:]
+        attributes.append(";".join(params) if all(param in ADDITIVE_SGR for param in params) else None)
+    return tuple(attributes)
+
 '''
 Parameters   :
 
@@ -0,0 +1,379 @@
+################################### IMPORTS ####################################
+
+from array import array
+from functools import lru_cache
+
+from lib.termio import *
+from lib.termio.screen import CHAR_TYPECODE
+
+################################### CLASSES ####################################
+
+class Canvas:
+    '''
+    Parameters   :
+
+        width  : Number of columns.
+
+        height : Number of rows.
+
+    Description  :
+
+        A fixed size grid of cells stored in two flat, preallocated arrays:
+        chars holds one character per cell and colors two bytes per cell, an
+        index into a palette of color codes (0 meaning no color). Drawing
+        functions write into the arrays in place, so a frame does not go
+        through the split / pad / join steps of the string functions.
+
+        A canvas is itself a frame: palette holds the color codes its colors
+        index (None for no color at all), FrameRenderer diffs the arrays
+        directly, and str() gives the string written to the terminal.
+
+    '''
+
+    __slots__ = ("width","height","chars","colors","palette","_color_view")
+
+    def __init__(self, width, height):
+        self.width   = width
+        self.height  = height
+        self.chars   = array(CHAR_TYPECODE," " * (width * height))
+        self.colors  = array("H",[0]) * (width * height) # "H" so 256 color palettes fit
+        self.palette = None
+
+        self._color_view = memoryview(self.colors)
+
+    def __str__(self):
+        return frame_string(self.chars.tounicode(),self.colors,self.width,self.height,self.palette)
+
+    def write(self, row, col, text):
+        '''
+        Writes a single line of text starting at the given cell. Text past
+        the right edge is cut off.
+        '''
+        chars = self.chars
+        for index, char in enumerate(text[:self.width - col],row * self.width + col):
+            chars[index] = char
+
+    def blit(self, row, col, text):
+        '''
+        Writes a multi line string with its top left corner at the given cell.
+        '''
+        for line_index, line in enumerate(text.split("\n")):
+            self.write(row + line_index,col,line)
+
+    def fill_colors(self, start, stop, color):
+        '''
+        Sets the color of cells start to stop (flat indices) to color.
+        '''
+        self._color_view[start:stop] = filled_colors(color,stop - start)
+
+    def fill_row_colors(self, row, colors):
+        '''
+        Sets the colors of a full row from an array("H") of length width.
+        '''
+        start = row * self.width
+        self._color_view[start:start + self.width] = colors
+
+    def text(self):
+        '''
+        Returns the canvas as a plain multi line string.
+        '''
+        chars = self.chars.tounicode()
+        return "\n".join(chars[row * self.width:(row + 1) * self.width] for row in range(self.height))
+
+    def encode(self, palette):
+        '''
+        Returns the string drawing the canvas in the given palette, see
+        encode_cells.
+        '''
+        return encode_cells(self.chars.tounicode(),self.colors,self.width,self.height,palette)
+
+    def snapshot(self):
+        '''
+        Returns a CanvasFrame holding a copy of the canvas as it is now.
+        '''
+        return CanvasFrame(self.width,self.height,self.chars.tounicode(),array("H",self.colors),self.palette)
+
+class CanvasFrame:
+    '''
+    Parameters   :
+
+        width, height, chars, colors, palette : As for Canvas, with chars a
+                                                string.
+
+    Description  :
+
+        Frozen copy of a Canvas, made by Canvas.snapshot, for frames that
+        are kept (e.g. in an AnimationCache) while the canvas is drawn on.
+        Renders exactly like the canvas it was taken from.
+
+    '''
+
+    __slots__ = ("width","height","chars","colors","palette")
+
+    def __init__(self, width, height, chars, colors, palette):
+        self.width   = width
+        self.height  = height
+        self.chars   = chars
+        self.colors  = colors
+        self.palette = palette
+
+    def __str__(self):
+        return frame_string(self.chars,self.colors,self.width,self.height,self.palette)
+
+class BannerTemplate:
+    '''
+    Parameters   :
+
+        canvas    : Canvas the banner is drawn on.
+
+        row, col  : Top left cell of the banner.
+
+        width, height, top_char, side_char : As for make_banner.
+
+        layout    : Banner text, as for make_banner, where a line of the
+                    form "{name}" is a slot filled in on every frame.
+
+    Description  :
+
+        A banner laid out once. draw puts the border and the static lines
+        of layout on the canvas, and records the row of each slot. fill
+        then only rewrites the slots whose text changed, at the column
+        make_banner would center them on, so a frame costs a few short
+        writes however large the rest of the canvas is.
+
+    '''
+
+    __slots__ = ("canvas","row","col","width","height","top_char","side_char",
+                 "static_text","slot_names","slot_rows","values")
+
+    def __init__(self, canvas, row, col, width, height, layout, top_char = "=", side_char = "|"):
+        self.canvas    = canvas
+        self.row       = row
+        self.col       = col
+        self.width     = width
+        self.height    = height
+        self.top_char  = top_char
+        self.side_char = side_char
+
+        #--- Find the slots ---------------------------------#
+        lines = layout.split("\n")
+        text_begin = (height // 2) - (len(lines) // 2)
+
+        self.slot_names = []
+        self.slot_rows  = []
+        for line_index, line in enumerate(lines):
+            if line.startswith("{") and line.endswith("}"):
+                self.slot_names.append(line[1:-1])
+                self.slot_rows.append(row + text_begin + line_index)
+                lines[line_index] = ""
+
+        self.static_text = "\n".join(lines)
+        self.values = None # slot text currently on the canvas, None if not drawn
+
+    def draw(self):
+        '''
+        Draws the banner with every slot empty.
+        '''
+        draw_banner(self.canvas,self.row,self.col,self.static_text,self.width,self.height,self.top_char,self.side_char)
+        self.values = [""] * len(self.slot_names)
+
+    def reset(self):
+        '''
+        Marks the banner as drawn over, so the next fill draws it again.
+        '''
+        self.values = None
+
+    def fill(self, values):
+        '''
+        Writes values, one per slot in the order of slot_names, into their
+        slots. Slots that already hold the same text are left alone.
+        '''
+        if self.values is None:
+            self.draw()
+
+        for slot_index, text in enumerate(values):
+            old_text = self.values[slot_index]
+            if text == old_text:
+                continue
+
+            row = self.slot_rows[slot_index]
+            if len(text) == len(old_text) and len(text) <= self.width - 2:
+                self.canvas.write(row,self.col + center_offset(len(text),self.width),text)
+            else:
+                if (len(text) > self.width): raise Exception('Text too large to fit in banner. (Max Line Length: {}) (Width: {})'.format(len(text),self.width))
+                self.canvas.write(row,self.col,text.center(self.width))
+                self.canvas.write(row,self.col,self.side_char)
+                self.canvas.write(row,self.col + self.width - 1,self.side_char)
+            self.values[slot_index] = text
+
+################################## FUNCTIONS ###################################
+
+def frame_string(chars, colors, width, height, palette):
+    '''
+    Returns the string a canvas frame is written as: encode_cells, or with
+    no palette the plain text after a color reset.
+    '''
+    if palette is None:
+        return RESET_COLOR + "\n".join(chars[row * width:(row + 1) * width] for row in range(height))
+    return encode_cells(chars,colors,width,height,palette)
+
+def encode_cells(chars, colors, width, height, palette):
+    '''
+    Parameters   :
+
+        chars, colors : Cells of a canvas, chars as a string.
+
+        width, height : Size of the canvas.
+
+        palette       : List of color codes. A cell color of n uses palette[n-1].
+
+    Return Value : String drawing the cells, colors included.
+
+    Description  :
+
+        Emits a color code only where the color actually changes, and
+        never on whitespace. Any extra attribute (such as bold) a skipped
+        whitespace color would have switched on is still applied, so the
+        result renders the same as coloring every cell.
+
+    '''
+
+    #=== Initialize =========================================#
+    attributes = color_attributes(tuple(palette))
+
+    output = []
+    current_color = 0
+    applied_attributes = set()
+
+    #=== Encode Rows ========================================#
+    for row in range(height):
+        if row:
+            output.append("\n")
+        run_start = row * width
+
+        for index in range(run_start,run_start + width):
+            color = colors[index]
+            if color == current_color or color == 0:
+                continue
+
+            #--- Whitespace keeps the current color -------------#
+            if chars[index].isspace():
+                extra = attributes[color - 1]
+                if extra and extra not in applied_attributes:
+                    output.append(chars[run_start:index])
+                    output.append("\u001b[" + extra + "m")
+                    applied_attributes.add(extra)
+                    run_start = index
+                continue
+
+            #--- Switch color -----------------------------------#
+            output.append(chars[run_start:index])
+            output.append(palette[color - 1])
+            current_color = color
+            if attributes[color - 1]:
+                applied_attributes.add(attributes[color - 1])
+            run_start = index
+
+        output.append(chars[run_start:(row + 1) * width])
+
+    return "".join(output)
+
+@lru_cache(maxsize = None)
+def center_offset(length, width):
+    '''
+    Returns the column str.center puts text of the given length at within
+    the given width.
+    '''
+    return ("x" * length).center(width).index("x") if length else 0
+
+@lru_cache(maxsize = None)
+def filled_colors(value, length):
+    '''
+    Returns a (cached, not to be changed) array("H") of the given length
+    filled with value.
+    '''
+    return array("H",[value]) * length
+
+def triangle_index(frame_number, sequence_length, period):
+    '''
+    Returns the color index the animations use for the given frame number,
+    bouncing back and forth over a sequence of the given length.
+    '''
+    color_index = frame_number % period
+    if color_index >= sequence_length:
+        color_index = period - color_index - 1
+    return color_index
+
+def draw_banner(canvas, row, col, text, width, height, top_char = "=", side_char = "|"):
+    '''
+    Parameters   :
+
+        canvas    : Canvas to draw on.
+
+        row, col  : Top left cell of the banner.
+
+        text, width, height, top_char, side_char : As for make_banner.
+
+    Description  :
+
+        Canvas version of make_banner. Draws the same banner in place.
+
+    '''
+
+    #=== Initialize =========================================#
+    text_list = text.split("\n")
+    if (height < 3): raise Exception('Banner height must be larger than 3. (Height: {})'.format(height))
+    if (max(map(len,text_list)) > width): raise Exception('Text too large to fit in banner. (Max Line Length: {}) (Width: {})'.format(max(map(len,text_list)),width))
+    if (height-2 < len(text_list)): raise Exception('Banner too small to fit text. (Banner Height: {}) (Number of Lines: {})'.format(height,len(text_list)))
+
+    text_begin = (height // 2) - (len(text_list) // 2)
+    text_end = text_begin + len(text_list)
+
+    #=== Draw Banner ========================================#
+    for line_index in range(height):
+        if(line_index == 0 or line_index == height-1):
+            canvas.write(row + line_index,col,top_char*width)
+        elif(line_index >= text_begin and line_index < text_end):
+            canvas.write(row + line_index,col,text_list[line_index-text_begin].center(width))
+            canvas.write(row + line_index,col,side_char)
+            canvas.write(row + line_index,col + width - 1,side_char)
+        else:
+            canvas.write(row + line_index,col,side_char+(" "*(width-2))+side_char)
+
+def canvas_pulse(canvas, frame_number, color_sequence, inverted = False):
+    '''
+    Canvas version of pulse. Colors every cell with the same color.
+    '''
+    color_index = triangle_index(frame_number,len(color_sequence),len(color_sequence)*2)
+    canvas.fill_colors(0,canvas.width * canvas.height,color_index + 1)
+
+def canvas_horiz_lines(canvas, frame_number, color_sequence, inverted = False):
+    '''
+    Canvas version of horiz_lines. Colors each row with one color.
+    '''
+    period = max(1,len(color_sequence)*2 - 2)
+    for row in range(canvas.height):
+        line_index = -row if inverted else row
+        color_index = (frame_number + line_index) % period
+        if color_index >= len(color_sequence):
+            color_index = period - color_index
+        canvas.fill_colors(row * canvas.width,(row + 1) * canvas.width,color_index + 1)
+
+def canvas_vert_lines(canvas, frame_number, color_sequence, inverted = False):
+    '''
+    Canvas version of vert_lines. Colors each column with one color.
+    '''
+    row_colors = vert_line_colors(frame_number % (len(color_sequence)*2),inverted,len(color_sequence),canvas.width)
+    for row in range(canvas.height):
+        canvas.fill_row_colors(row,row_colors)
+
+@lru_cache(maxsize = None)
+def vert_line_colors(phase, inverted, sequence_length, width):
+    '''
+    Returns vert_line_table as canvas colors (palette index + 1), as a
+    (cached, not to be changed) array("H").
+    '''
+    return array("H",[color_index + 1 for color_index in vert_line_table(phase,inverted,sequence_length,width)])
+
+# Canvas version of each string animation function
+CANVAS_ANIMATIONS = {pulse:canvas_pulse, horiz_lines:canvas_horiz_lines, vert_lines:canvas_vert_lines}
@@ -0,0 +1,98 @@
+################################### IMPORTS ####################################
+
+# pyfiglet is slow to import and only needed for large text, so it is only
+# imported once a GlyphCache is made.
+
+################################## CONSTANTS ###################################
+
+# Fonts tried for large text, largest first
+LARGE_FONTS = ["colossal","banner3","big","standard","small","mini"]
+
+DIGITS = "0123456789"
+
+################################### GLOBALS ####################################
+
+################################### CLASSES ####################################
+
+class GlyphCache:
+    '''
+    Parameters   :
+
+        font : Name of the figlet font.
+
+    Description  :
+
+        Large text in a figlet font, built from glyphs that are each rendered
+        by pyfiglet only once. render puts text together by joining the
+        cached rows of its glyphs side by side, which costs a few string
+        joins instead of a full figlet layout per call. Glyphs are not
+        smushed together, and digits are padded to a common width so a
+        countdown does not shift sideways as it changes.
+
+    '''
+
+    def __init__(self, font):
+        import pyfiglet
+
+        self.font   = font
+        self.figlet = pyfiglet.Figlet(font = font, width = 1000)
+        self.height = self.figlet.Font.height
+        self.glyphs = {}
+
+        #--- Pad the digits to a common width ---------------#
+        digits = [self._render(char) for char in DIGITS]
+        digit_width = max(len(rows[0]) for rows in digits)
+        for char, rows in zip(DIGITS,digits):
+            self.glyphs[char] = [row.center(digit_width) for row in rows]
+
+    def glyph(self, char):
+        '''
+        Returns the rows of a single character, rendering it on first use.
+        '''
+        rows = self.glyphs.get(char)
+        if rows is None:
+            rows = self.glyphs[char] = self._render(char)
+        return rows
+
+    def render(self, text):
+        '''
+        Returns text as a list of height rows, all the same length.
+        '''
+        glyphs = [self.glyph(char) for char in text]
+        return ["".join(rows[row] for rows in glyphs) for row in range(self.height)]
+
+    def width(self, text):
+        '''
+        Returns the number of columns render(text) takes.
+        '''
+        return sum(len(self.glyph(char)[0]) for char in text)
+
+    def _render(self, char):
+        rows = self.figlet.renderText(char).split("\n")[:self.height]
+        rows += [""] * (self.height - len(rows))
+        width = max(map(len,rows))
+        return [row.ljust(width) for row in rows]
+
+################################## FUNCTIONS ###################################
+
+def fit_font(texts, cols, rows, fonts = LARGE_FONTS):
+    '''
+    Parameters   :
+
+        texts : List of strings that must each fit on one line of large text.
+
+        cols  : Columns available.
+
+        rows  : Rows available for each line of large text.
+
+        fonts : Font names to try, largest first.
+
+    Return Value : GlyphCache of the first font in which every text fits, or
+                   of the last font if none do.
+
+    '''
+    for font in fonts:
+        glyphs = GlyphCache(font)
+        if glyphs.height <= rows and all(glyphs.width(text) <= cols for text in texts):
+            return glyphs
+    return glyphs
@@ -0,0 +1,522 @@
+################################### IMPORTS ####################################
+
+import os,re,sys
+from array import array,typecodes
+
+from lib.termio.animation import color_attributes
+
+################################## CONSTANTS ###################################
+
+SGR_PATTERN = re.compile("\u001b\\[([0-9;]*)m")
+
+# A cell style is a (foreground params, bold) pair. Only the attributes the
+# color sequences in lib.termio.animation use are tracked.
+DEFAULT_STYLE = (None,False)
+
+# 'u' is deprecated from Python 3.13 on in favour of 'w'
+CHAR_TYPECODE = "w" if "w" in typecodes else "u"
+
+# Synchronized update (DEC private mode 2026): the terminal holds off
+# drawing between the two, so a frame never shows half drawn. Terminals
+# without it ignore the unknown mode.
+SYNC_BEGIN = "\u001b[?2026h".encode()
+SYNC_END   = "\u001b[?2026l".encode()
+
+# Written before the first frame and after the last one
+SESSION_START = "\r\u001b7\u001b[?25l"
+SESSION_END   = "\u001b[0m\u001b[?25h\n"
+
+################################### CLASSES ####################################
+
+class FrameRenderer:
+    '''
+    Parameters   :
+
+        write : Callable taking a string (bytes if binary), used for all
+                output. (Default: sys.stdout.write)
+
+        diff  : If True, only cells that changed since the last frame are
+                written. If False, every frame is written in full.
+
+        binary : If True, write is passed UTF-8 encoded bytes instead of a
+                 string, so each frame is encoded exactly once.
+
+    Description  :
+
+        Draws frames at the position saved with save_cursor, and for each
+        new frame only emits the cursor moves, color changes and characters
+        for the cells that differ from the last one.
+
+        A frame is either a multi line string with SGR color escapes, kept
+        as a grid of (char, style) cells, or a Canvas (or CanvasFrame).
+        A canvas is diffed straight from its chars and colors arrays
+        against two arrays of the last frame's chars and style numbers,
+        updated in place, so drawing it allocates little more than the
+        output. Both kinds give the same output for the same picture.
+
+        Every frame is drawn from the position saved with ESC 7, and
+        returning there with ESC 8 also restores the color saved with it
+        (the default one), so each frame's text starts in the default
+        style and the renderer forgets the terminal's color whenever it
+        moves back with ESC 8.
+
+        frame_bytes holds the number of UTF-8 bytes written for the last
+        frame, total_bytes and frames the running totals.
+
+    '''
+
+    def __init__(self, write = None, diff = True, binary = False):
+        self.write  = write or sys.stdout.write
+        self.diff   = diff
+        self.binary = binary
+
+        self.cells       = None          # grid of the last drawn string frame
+        self.term_style  = None          # style the terminal is currently in
+        self.cursor      = (0,0)         # cursor position relative to the saved origin
+
+        #--- Last drawn canvas frame ------------------------#
+        self.chars       = None # its chars
+        self.styles      = None # its cell styles, as indices into style_table (0 for a space)
+        self.width       = 0
+        self.style_table = [None]
+        self.style_index = {}
+        self.style_sgr   = [None] # encoded
+
+        self._palette     = None # palette the transitions below are for
+        self._transitions = {}   # style -> {color: style after switching to it}
+        self._attributes  = ()
+        self._applied     = set()
+        self._moves       = {}   # (row, col) or column step -> its encoded escapes
+        self._char_data   = {}   # char -> its encoding
+
+        self.frame_bytes = 0
+        self.total_bytes = 0
+        self.frames      = 0
+
+    def render(self, frame):
+        '''
+        Draws the given frame, returning the number of bytes written.
+        '''
+        if not isinstance(frame,str):
+            return self.render_canvas(frame)
+
+        #=== Initialize =========================================#
+        cells, end_style = rasterize(frame)
+
+        #=== Build Output =======================================#
+        if not self.diff or self.cells is None or len(cells) != len(self.cells):
+            output = "\u001b8" + frame
+            self.term_style = end_style
+            self.cursor = (len(cells) - 1, len(cells[-1]))
+        else:
+            output = self._diff(cells)
+
+        #=== Write ==============================================#
+        self.cells = cells
+        self.chars = None
+        self._emit(output)
+
+        return self.frame_bytes
+
+    def render_canvas(self, frame):
+        '''
+        Parameters   :
+
+            frame : Canvas or CanvasFrame to draw.
+
+        Return Value : Number of bytes written.
+
+        Description  :
+
+            Works out the style of each cell the way the terminal would
+            when reading str(frame) (colors switch on non-space cells,
+            extra attributes of skipped whitespace colors still apply),
+            compares it and the char with the last frame and writes each
+            run of changed cells. The output is put together as bytes
+            from escapes and chars encoded once and kept, so a frame
+            allocates little besides the output itself.
+
+        '''
+
+        #=== Initialize =========================================#
+        chars, colors, palette, width = frame.chars, frame.colors, frame.palette, frame.width
+        size = width * frame.height
+        full = not self.diff or self.chars is None or len(self.chars) != size or self.width != width
+        if self.chars is None or len(self.chars) != size:
+            self.chars  = array(CHAR_TYPECODE," ") * size
+            self.styles = array("I",[0]) * size
+        self.cells = None
+        self.width = width
+
+        if palette is not self._palette:
+            self._palette     = palette
+            self._transitions = {}
+            self._attributes  = color_attributes(tuple(palette)) if palette is not None else ()
+
+        old_chars, old_styles = self.chars, self.styles
+        transitions, attributes, applied = self._transitions, self._attributes, self._applied
+        style_index, style_table, style_sgr = self.style_index, self.style_table, self.style_sgr
+        char_data = self._char_data
+        applied.clear()
+
+        style = DEFAULT_STYLE
+        style_number = style_index.get(style) or self._add_style(style)
+        current_color = 0
+        output = bytearray()
+
+        #=== Diff Cells =========================================#
+        for row in range(frame.height):
+            run = False
+            for index in range(row * width,(row + 1) * width):
+                char = chars[index]
+
+                #--- Follow the color codes -------------------------#
+                if palette is not None:
+                    color = colors[index]
+                    if color != current_color and color:
+                        if char.isspace():
+                            extra = attributes[color - 1]
+                            if not extra or extra in applied:
+                                color = 0
+                            else:
+                                applied.add(extra)
+                                color = -color # the extra attribute alone
+                        else:
+                            current_color = color
+                            if attributes[color - 1]:
+                                applied.add(attributes[color - 1])
+                        if color:
+                            next_styles = transitions.get(style)
+                            if next_styles is None:
+                                next_styles = transitions[style] = {}
+                            next_style = next_styles.get(color)
+                            if next_style is None:
+                                params = attributes[-color - 1] if color < 0 else palette[color - 1][2:-1]
+                                next_style = apply_sgr(style,params)
+                                next_style = next_styles[color] = style_table[style_index.get(next_style) or self._add_style(next_style)]
+                            style = next_style
+                            style_number = style_index[style]
+
+                #--- Compare with the last frame --------------------#
+                cell_style = style_number if char != " " else 0
+                if full:
+                    old_chars[index] = char
+                    old_styles[index] = cell_style
+                elif char != old_chars[index] or cell_style != old_styles[index]:
+                    if not run:
+                        output += self._move_data(row,index - row * width)
+                        run = True
+                    if cell_style and style_table[cell_style] != self.term_style:
+                        output += style_sgr[cell_style]
+                        self.term_style = style_table[cell_style]
+                    data = char_data.get(char)
+                    if data is None:
+                        data = char_data[char] = char.encode()
+                    output += data
+                    old_chars[index] = char
+                    old_styles[index] = cell_style
+                elif run:
+                    self.cursor = (row,index - row * width)
+                    run = False
+            if run:
+                self.cursor = (row,width)
+
+        #=== Write ==============================================#
+        if full:
+            output = "\u001b8" + str(frame)
+            self.term_style = style
+            self.cursor = (frame.height - 1,width)
+        self._emit(output)
+
+        return self.frame_bytes
+
+    def park(self):
+        '''
+        Moves the cursor to the end of the last drawn frame, where a full
+        redraw would have left it.
+        '''
+        grid = self.grid()
+        if grid is None:
+            return
+        output = self._move_to(len(grid) - 1, len(grid[-1]))
+        if output:
+            data = output.encode()
+            self.write(data if self.binary else output)
+            self.total_bytes += len(data)
+
+    def grid(self):
+        '''
+        Returns the last drawn frame as a grid of (char, style) cells, or
+        None if nothing has been drawn.
+        '''
+        if self.chars is None:
+            return self.cells
+        width, chars, styles, style_table = self.width, self.chars, self.styles, self.style_table
+        return [[(chars[index],style_table[styles[index]]) for index in range(start,start + width)]
+                for start in range(0,len(chars),width)]
+
+    def keyframe(self):
+        '''
+        Returns the output that draws the last frame on a terminal in any
+        state, leaving its cursor and color where the next frame's changes
+        expect them. Used to bring a terminal that missed frames (or
+        joined late) back in step.
+        '''
+        grid = self.grid()
+        if grid is None:
+            return ""
+
+        #=== Draw Cells =========================================#
+        output = ["\u001b8"]
+        style = None
+        for row_index, row in enumerate(grid):
+            if row_index:
+                output.append("\n")
+            for char, cell_style in row:
+                if cell_style is not None and cell_style != style:
+                    output.append(sgr(cell_style))
+                    style = cell_style
+                output.append(char)
+
+        #=== Restore Cursor and Color ===========================#
+        output.append(origin_move(*self.cursor))
+        if self.term_style is not None:
+            output.append(sgr(self.term_style))
+
+        return "".join(output)
+
+    def _add_style(self, style):
+        '''
+        Numbers a style not seen before, returning its number.
+        '''
+        self.style_index[style] = len(self.style_table)
+        self.style_table.append(style)
+        self.style_sgr.append(sgr(style).encode())
+        return len(self.style_table) - 1
+
+    def _emit(self, output):
+        data = output.encode() if isinstance(output,str) else output
+        self.frame_bytes = len(data)
+        self.total_bytes += self.frame_bytes
+        self.frames += 1
+        if not data:
+            return
+        if self.binary:
+            self.write(data)
+        else:
+            self.write(output if isinstance(output,str) else data.decode())
+
+    def _move_to(self, row, col):
+        '''
+        Returns the escapes moving the cursor from its current cell to the
+        given one.
+        '''
+        return self._move_data(row,col).decode()
+
+    def _move_data(self, row, col):
+        '''
+        Returns the encoded escapes moving the cursor from its current cell
+        to the given one. They are kept for the next frames to reuse. A move
+        through ESC 8 leaves the terminal in the default style.
+        '''
+        cur_row, cur_col = self.cursor
+        self.cursor = (row,col)
+
+        if row == cur_row and col >= cur_col:
+            key = col - cur_col
+        else:
+            key = (row,col)
+            self.term_style = DEFAULT_STYLE # ESC 8 restores the saved color too
+        move = self._moves.get(key)
+        if move is None:
+            move = self._moves[key] = ("\u001b[{}C".format(key) if type(key) is int else origin_move(*key)).encode()
+        return move if key else b""
+
+    def _diff(self, cells):
+        '''
+        Returns the output that turns the last drawn grid into cells.
+        '''
+        output = []
+
+        for row_index, (new_row, old_row) in enumerate(zip(cells, self.cells)):
+            if new_row == old_row:
+                continue
+
+            #--- Pad to cover any leftovers of the old row ------#
+            width = max(len(new_row), len(old_row))
+            if len(new_row) < width:
+                new_row = new_row + [(" ",None)] * (width - len(new_row))
+
+            #--- Write each run of changed cells ----------------#
+            col = 0
+            while col < width:
+                if col < len(old_row) and new_row[col] == old_row[col]:
+                    col += 1
+                    continue
+
+                output.append(self._move_to(row_index, col))
+                while col < width and (col >= len(old_row) or new_row[col] != old_row[col]):
+                    char, style = new_row[col]
+                    if style is not None and style != self.term_style:
+                        output.append(sgr(style))
+                        self.term_style = style
+                    output.append(char)
+                    col += 1
+                self.cursor = (row_index, col)
+
+        return "".join(output)
+
+class NullRenderer:
+    '''
+    FrameRenderer that only counts frames, for running a session's timing
+    without a terminal.
+    '''
+    frame_bytes = 0
+    total_bytes = 0
+
+    def __init__(self):
+        self.frames = 0
+
+    def render(self, frame):
+        self.frames += 1
+        return 0
+
+    def park(self):
+        pass
+
+class TerminalOutput:
+    '''
+    Parameters   :
+
+        fd           : File descriptor to write to. (Default: stdout's)
+
+        synchronized : If True, each write is wrapped in SYNC_BEGIN and
+                       SYNC_END.
+
+    Description  :
+
+        Byte level write target for FrameRenderer (with binary = True).
+        Each write is put together in one reusable bytearray, between the
+        pre-encoded synchronized update escapes, and handed to the terminal
+        with a single os.write, bypassing sys.stdout's text layer and its
+        line buffering, which would otherwise flush a frame in pieces at
+        every newline. sys.stdout is flushed once on creation so anything
+        already printed comes first.
+
+        writes holds the number of os.write calls made.
+
+    '''
+
+    def __init__(self, fd = None, synchronized = True):
+        if fd is None:
+            sys.stdout.flush()
+            fd = sys.stdout.fileno()
+        self.fd           = fd
+        self.synchronized = synchronized
+        self.buffer       = bytearray()
+        self.writes       = 0
+
+    def write(self, data):
+        '''
+        Writes data (bytes-like, or a string to encode) as one update.
+        '''
+        buffer = self.buffer
+        del buffer[:]
+        if self.synchronized: buffer += SYNC_BEGIN
+        buffer += data.encode() if isinstance(data,str) else data
+        if self.synchronized: buffer += SYNC_END
+
+        #--- Only a full pipe or a signal splits a write ----#
+        written = os.write(self.fd,buffer)
+        self.writes += 1
+        while written < len(buffer):
+            with memoryview(buffer) as view:
+                rest = view[written:]
+                written += os.write(self.fd,rest)
+                rest.release()
+            self.writes += 1
+
+################################## FUNCTIONS ###################################
+
+def apply_sgr(style, params):
+    '''
+    Returns the style that results from applying the given SGR parameter
+    string (the part between "ESC[" and "m") to style.
+    '''
+
+    #=== Initialize =========================================#
+    fg, bold = style
+    params = params.split(";") if params else ["0"]
+
+    #=== Apply Parameters ===================================#
+    index = 0
+    while index < len(params):
+        param = params[index]
+        if param in ("","0"):
+            fg, bold = DEFAULT_STYLE
+        elif param == "1":
+            bold = True
+        elif param == "22":
+            bold = False
+        elif param == "39":
+            fg = None
+        elif param == "38" and index + 2 < len(params) and params[index + 1] == "5":
+            fg = "38;5;" + params[index + 2]
+            index += 2
+        else:
+            fg = param
+        index += 1
+
+    return (fg,bold)
+
+def origin_move(row, col):
+    '''
+    Returns the escapes moving the cursor to the given cell, counted from
+    the saved cursor position.
+    '''
+    output = "\u001b8"
+    if row > 0: output += "\u001b[{}B".format(row)
+    if col > 0: output += "\u001b[{}C".format(col)
+    return output
+
+def sgr(style):
+    '''
+    Returns the escape sequence putting the terminal in the given style from
+    any other style.
+    '''
+    fg, bold = style
+    params = "0"
+    if fg is not None: params += ";" + fg
+    if bold: params += ";1"
+    return "\u001b[" + params + "m"
+
+def rasterize(text, style = DEFAULT_STYLE):
+    '''
+    Parameters   :
+
+        text  : Multi line string, optionally containing SGR escapes.
+
+        style : Style in effect before the first character of text.
+
+    Return Value : Tuple of (grid, style). grid is a list of rows, each a list
+                   of (char, style) cells, and style is the style in effect
+                   after the last character.
+
+    Description  :
+
+        Splits colored text into the cells a terminal would display. Spaces
+        are stored with a style of None since only foreground attributes are
+        tracked, which leave a space looking the same in any style.
+
+    '''
+    grid = []
+    for line in text.split("\n"):
+        row = []
+        position = 0
+        for match in SGR_PATTERN.finditer(line):
+            row.extend((char, style if char != " " else None) for char in line[position:match.start()])
+            style = apply_sgr(style, match.group(1))
+            position = match.end()
+        row.extend((char, style if char != " " else None) for char in line[position:])
+        grid.append(row)
+    return grid, style
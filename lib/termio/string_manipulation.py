@@ -1,5 +1,7 @@
 ################################### IMPORTS ####################################
 
+from functools import lru_cache
+
 from lib.termio import *
 
 ################################## CONSTANTS ###################################
@@ -138,7 +140,97 @@ def multi_line_join(*argv,padding=0):
     return "\n".join(lines)
 
 
-def progress_bar(width,progress,bar_chars=DEFAULT_BAR, brackets = [],inverted = False):
+######################################################################################
+#                                                                       progress_bar #
+######################################################################################
+
+class ProgressBar:
+    '''
+    Parameters   :
+
+        width     : Integer number of characters for progress bar
+                    (including brackets, if any).
+
+        bar_chars : List of characters to represent unfilled/filling/filled portions
+                    of the progress bar. (Mininmum 2 characters)
+
+        brackets  : List (or tuple), maximum length of 2, of characters representing
+                    the beginning and ending brackets of the bar.
+
+    Description  :
+
+        Progress bar of a fixed width and set of characters. A bar only has
+        width * len(bar_chars) + 1 possible states, so render quantizes the
+        progress to a state and looks its string up in a table, building
+        each string the first time it is needed. Inverted bars (bar_chars
+        reversed) have a table of their own.
+
+    '''
+
+    __slots__ = ("width","bar_chars","brackets","inner_width","levels","tables")
+
+    def __init__(self, width, bar_chars = DEFAULT_BAR, brackets = ()):
+        #--- Error Checking ---------------------------------#
+        if(len(brackets) > 2): raise Exception("Too many brackets provided. (Number of Brackets: {})".format(len(brackets)))
+        if(width < 1 + len(brackets)): raise Exception("Width must be positive. (Width: {})".format(width))
+        if(len(bar_chars) < 2): raise Exception("Not enough bar characters provided. (Number of Chars: {})".format(len(bar_chars)))
+
+        self.width       = width
+        self.bar_chars   = tuple(bar_chars)
+        self.brackets    = tuple(brackets)
+        self.inner_width = width - len(brackets)
+        self.levels      = len(bar_chars)
+
+        # One slot per state, the last one being a full bar
+        self.tables = {False:[None] * (self.inner_width * self.levels + 1),
+                       True :[None] * (self.inner_width * self.levels + 1)}
+
+    def render(self, progress, inverted = False):
+        '''
+        Returns the bar filled to progress, a float between 0 and 1.
+        '''
+        if(progress < 0 or progress > 1): raise Exception("Progress must be float between 0 and 1. (Progress: {})".format(progress))
+
+        #--- Quantize ---------------------------------------#
+        filled = self.inner_width * progress
+        state = int(filled) * self.levels + int((filled % 1) * self.levels)
+
+        table = self.tables[inverted]
+        bar = table[state]
+        if bar is None:
+            bar = table[state] = self.build(state,inverted)
+        return bar
+
+    def build(self, state, inverted = False):
+        '''
+        Returns the string of the given state.
+        '''
+        bar_chars = self.bar_chars[::-1] if inverted else self.bar_chars
+        num_full, mid_index = divmod(state,self.levels)
+
+        #=== Make Bar ===========================================#
+        if num_full == self.inner_width:
+            bar = bar_chars[-1] * num_full
+        else:
+            bar = bar_chars[-1] * num_full + bar_chars[mid_index] + bar_chars[0] * (self.inner_width - num_full - 1)
+
+        #--- Add Brackets -----------------------------------#
+        if len(self.brackets) > 0:
+            bar = self.brackets[0] + bar
+        if len(self.brackets) > 1:
+            bar += self.brackets[1]
+
+        return bar
+
+@lru_cache(maxsize = 64)
+def get_progress_bar(width, bar_chars = tuple(DEFAULT_BAR), brackets = ()):
+    '''
+    Returns a shared ProgressBar for the given width, bar_chars and brackets
+    (as tuples).
+    '''
+    return ProgressBar(width,bar_chars,brackets)
+
+def progress_bar(width,progress,bar_chars=DEFAULT_BAR, brackets = (),inverted = False):
     '''
     Parameters   :
 
@@ -150,11 +242,13 @@ def progress_bar(width,progress,bar_chars=DEFAULT_BAR, brackets = [],inverted =
         bar_chars : List of characters to represent unfilled/filling/filled portions
                     of the progress bar. (Mininmum 2 characters)
 
-                    Default: [" ","░","▒","█"]
+                    Default: VERTICAL_LOAD
 
         brackets  : List (or tuple), maximum length of 2, of characters representing
                     the beginning and ending brackets of the bar.
 
+        inverted  : If True, the bar empties instead of filling.
+
     Return Value : Single line string of progress bar filled to given percentage.
 
     Description  :
@@ -164,46 +258,11 @@ def progress_bar(width,progress,bar_chars=DEFAULT_BAR, brackets = [],inverted =
         displays the appropriate character in the bar_chars list. Can cap the list
         with closing and ending brackets, but does not do so by default.
 
-    '''
-
-    #=== Initialize =========================================#
+        Bars come from a ProgressBar shared by every call with the same width,
+        bar_chars and brackets, see get_progress_bar.
 
-    if inverted:
-        bar_chars = list(reversed(bar_chars))
-    #--- Error Checking ---------------------------------#
-    if(width < 1 + len(brackets)): raise Exception("Width must be positive. (Width: {})".format(width))
-    if(progress < 0 or progress > 1): raise Exception("Progress must be float between 0 and 1. (Progress: {})".format(progress))
-    if(len(bar_chars) < 2): raise Exception("Not enough bar characters provided. (Number of Chars: {})".format(len(bar_charss)))
-
-    #--- Set Variables ----------------------------------#
-    empty_char = bar_chars[0]
-    full_char  = bar_chars[-1]
-    mid_char   = full_char if progress == 1  else bar_chars[math.floor((width*progress%1)*len(bar_chars))]
-
-    num_full   = int(width * progress)
-    num_empty  = width-(num_full+1)
-
-    #=== Make Bar ===========================================#
-    bar = ""
-    #--- Full Chars -------------------------------------#
-    bar += full_char * num_full
-    #--- Mid Chars --------------------------------------#
-    bar += mid_char
-    #--- Empty Chars ------------------------------------#
-    bar += empty_char * num_empty
-    #--- Add Brackets -----------------------------------#
-    if(len(brackets) > 2):
-        # Add first bracket
-        try: bar = brackets[0] + bar
-        except: pass
-
-        # Add second bracket
-        try: bar += brackets[1]
-        except: pass
-
-    #=== Return =============================================#
-
-    return bar
+    '''
+    return get_progress_bar(width,tuple(bar_chars),tuple(brackets)).render(progress,inverted)
 
 
 '''
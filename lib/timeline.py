@@ -0,0 +1,111 @@
+################################### IMPORTS ####################################
+
+from bisect import bisect_right
+from itertools import accumulate
+
+################################## CONSTANTS ###################################
+
+# Event kinds, in the order events at the same offset are kept in
+PHASE_EVENT = "phase"
+BEEP_EVENT  = "beep"
+END_EVENT   = "end"
+
+################################### CLASSES ####################################
+
+class Timeline:
+    '''
+    Parameters   :
+
+        phases : List of (name, duration) tuples, in order.
+
+        beeps  : List of (offset, frequency, duration, count, step) tuples,
+                 offset in seconds from the start of the session.
+
+    Description  :
+
+        The schedule of a session, compiled once into events at absolute
+        offsets from its start: the start of each phase, each beep and the
+        end. The frame loop (through Session.phase) and the beep player
+        both read it against the same clock, so a cue and the phase change
+        it marks fall due at the same offset instead of being added up
+        separately on each side.
+
+        events is a list of (offset, kind, value) tuples sorted by offset,
+        and kind_events splits it by kind. Lookups bisect the offsets, so
+        they stay cheap however many phases and beeps a profile has.
+
+    '''
+
+    def __init__(self, phases, beeps):
+        starts = [0] + list(accumulate(duration for _, duration in phases))
+        self.end_time = starts[-1]
+
+        events  = [(start,PHASE_EVENT,name) for start, (name, _) in zip(starts,phases)]
+        events += [(beep[0],BEEP_EVENT,tuple(beep[1:])) for beep in beeps]
+        events += [(self.end_time,END_EVENT,None)]
+        self.events  = sorted(events,key = lambda event: event[0]) # stable, so kinds keep their order
+        self.offsets = [event[0] for event in self.events]
+
+        self.kind_events  = {kind:[event for event in self.events if event[1] == kind]
+                             for kind in (PHASE_EVENT,BEEP_EVENT,END_EVENT)}
+        self.kind_offsets = {kind:[event[0] for event in kind_events]
+                             for kind, kind_events in self.kind_events.items()}
+
+        self.phase_starts = starts[:-1]
+        self.phase_names  = [name for name, _ in phases]
+
+    def phase(self, cur_time):
+        '''
+        Returns the name of the phase at cur_time. Before the start this is
+        the first phase, after the end the last.
+        '''
+        return self.phase_names[max(0,bisect_right(self.phase_starts,cur_time) - 1)]
+
+    def next_event(self, cur_time, kind = None):
+        '''
+        Returns the first (offset, kind, value) event after cur_time, only
+        counting events of the given kind if one is given, or None if there
+        are no more.
+        '''
+        events, offsets = (self.events,self.offsets) if kind is None else (self.kind_events[kind],self.kind_offsets[kind])
+        index = bisect_right(offsets,cur_time)
+        return events[index] if index < len(events) else None
+
+    def frame_after(self, cur_time, period):
+        '''
+        Returns the time of the frame after one drawn at cur_time: period
+        seconds later, or the start of the next phase if that comes first,
+        so the first frame of a phase is drawn on its start.
+        '''
+        phase_change = self.next_event(cur_time,PHASE_EVENT)
+        if phase_change is not None and phase_change[0] < cur_time + period:
+            return phase_change[0]
+        return cur_time + period
+
+    def beeps(self):
+        '''
+        Returns the beeps as (offset, beep) tuples, each beep being the tuple
+        play_beep takes.
+        '''
+        schedule = []
+        previous = 0
+        for offset, kind, value in self.events:
+            if kind == BEEP_EVENT:
+                schedule.append((offset,(offset - previous,) + value))
+                previous = offset
+        return schedule
+
+    def beep_list(self):
+        '''
+        Returns the beeps as a relative beep list, as for sound_thread.
+        '''
+        return [beep for _, beep in self.beeps()]
+
+################################## FUNCTIONS ###################################
+
+def beep_schedule(beep_list):
+    '''
+    Returns a relative beep list (as for sound_thread) as (offset, beep)
+    tuples, like Timeline.beeps.
+    '''
+    return list(zip(accumulate(beep[0] for beep in beep_list),beep_list))